@@ -9,6 +9,10 @@ db = SQLAlchemy()
 global_bot = None
 global_loop = None
 
+# SQLAlchemy 连接池大小；Bot 的 DB 线程池与之等大，Flask 线程使用溢出连接
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+
 def create_app():
     app = Flask(__name__)
     
@@ -19,6 +23,12 @@ def create_app():
         
     app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if not db_uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_pre_ping': True,
+        }
     
     # SECRET_KEY 配置 - 生产环境必须设置
     secret_key = os.getenv('SECRET_KEY', 'default_secret_key')
@@ -27,6 +37,10 @@ def create_app():
     app.config['SECRET_KEY'] = secret_key
     
     db.init_app(app)
+    with app.app_context():
+        # SQL 计数与耗时，/core/metrics 导出
+        from app.metrics import instrument_engine
+        instrument_engine(db.engine)
     
     # 注册过滤器
     @app.template_filter('from_json')
@@ -0,0 +1,179 @@
+from . import db
+from .models import GroupUser
+from .search import index_profiles
+from sqlalchemy import Text, cast, func
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime
+import csv
+import io
+import json
+
+IMPORT_CHUNK_SIZE = 500  # Rows per upsert statement / transaction
+IMPORT_MAX_ERRORS = 100  # Row errors reported back to the admin panel
+EXPORT_BATCH_SIZE = 1000  # Rows per keyset batch while streaming an export
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+class RowError(ValueError):
+    """A row that failed validation."""
+
+def _parse_date(value):
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try: return datetime.strptime(value, fmt)
+        except ValueError: continue
+    raise RowError(f"无效的到期时间: {value}")
+
+def iter_records(stream, fmt):
+    """Yield (line_no, dict) from a binary CSV or JSONL stream, one line at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None
+            continue
+        yield line_no, record
+
+def validate_record(record, fields):
+    """Turn one CSV/JSONL record into upsert values, checked against the group's fields."""
+    if not isinstance(record, dict):
+        raise RowError("无法解析该行")
+    try:
+        tg_id = int(str(record.get('tg_id', '')).strip())
+    except ValueError:
+        raise RowError("tg_id 缺失或不是数字")
+    source = record.get('profile') if isinstance(record.get('profile'), dict) else record
+    profile = {}
+    for f in fields:
+        # 列名可用字段 key，也可用显示名
+        value = source.get(f['key'], source.get(f.get('label')))
+        if value is None or value == '':
+            continue
+        value = str(value).strip()
+        if f.get('type') == 'select' and f.get('options') and value not in f['options']:
+            raise RowError(f"{f.get('label', f['key'])} 不在可选项中: {value}")
+        profile[f['key']] = value
+    expiration = record.get('expiration_date')
+    return {
+        'tg_id': tg_id,
+        'profile': profile,
+        'expiration_date': _parse_date(expiration) if expiration not in (None, '') else None,
+    }
+
+def _upsert_statement(rows):
+    dialect = db.engine.dialect.name
+    table = GroupUser.__table__
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(table).values(rows)
+        existing = cast(func.coalesce(table.c.profile_data, '{}'), postgresql.JSONB)
+        merged = cast(existing.op('||')(cast(stmt.excluded.profile_data, postgresql.JSONB)), Text)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table).values(rows)
+        merged = func.json_patch(func.coalesce(table.c.profile_data, '{}'), stmt.excluded.profile_data)
+    else:
+        raise RuntimeError(f"批量导入不支持 {dialect} 数据库")
+    # 已存在的 (group_id, tg_id) 只合并文件里有值的资料字段，缺列、空单元格保留原值；到期时间同理
+    return stmt.on_conflict_do_update(
+        index_elements=['group_id', 'tg_id'],
+        set_={
+            'profile_data': merged,
+            'expiration_date': func.coalesce(stmt.excluded.expiration_date, table.c.expiration_date),
+        }
+    )
+
+def upsert_chunk(group_id, records):
+    """
+    Upsert validated records and reindex them in one transaction.
+
+    Returns {user_id: record}, each record carrying the merged profile as stored.
+    """
+    by_tg = {r['tg_id']: r for r in records}  # 同一块内重复的 tg_id 以最后一行为准
+    rows = [{
+        'group_id': group_id,
+        'tg_id': tg_id,
+        'profile_data': json.dumps(r['profile'], ensure_ascii=False),
+        'expiration_date': r['expiration_date'],
+        'is_banned': False,
+        'online': False,
+    } for tg_id, r in by_tg.items()]
+    try:
+        db.session.execute(_upsert_statement(rows))
+        stored = db.session.query(GroupUser.id, GroupUser.tg_id, GroupUser.profile_data).filter(
+            GroupUser.group_id == group_id, GroupUser.tg_id.in_(list(by_tg))
+        ).all()
+        saved = {}
+        for uid, tg_id, raw in stored:
+            try: profile = json.loads(raw) if raw else {}
+            except ValueError: profile = by_tg[tg_id]['profile']
+            saved[uid] = dict(by_tg[tg_id], profile=profile)
+        index_profiles(group_id, {uid: r['profile'] for uid, r in saved.items()})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return saved
+
+def import_users(group_id, fields, stream, fmt, on_chunk=None):
+    """
+    Stream-import a CSV/JSONL upload into a group. Needs an app context.
+
+    Invalid rows are skipped and reported; valid ones are upserted in chunks
+    of IMPORT_CHUNK_SIZE. on_chunk(saved) runs after each committed chunk.
+    """
+    imported, errors, chunk = 0, [], []
+
+    def _flush():
+        nonlocal imported
+        saved = upsert_chunk(group_id, chunk)
+        imported += len(saved)
+        chunk.clear()
+        if on_chunk: on_chunk(saved)
+
+    for line_no, record in iter_records(stream, fmt):
+        try:
+            chunk.append(validate_record(record, fields))
+        except RowError as e:
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({'line': line_no, 'msg': str(e)})
+            continue
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            _flush()
+    if chunk:
+        _flush()
+    return imported, errors
+
+def export_users(group_id, fields, fmt):
+    """Yield a group's users as CSV or JSONL text chunks, in keyset batches."""
+    keys = [f['key'] for f in fields]
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(['tg_id', 'expiration_date', 'is_banned'] + keys)
+        yield '\ufeff' + buf.getvalue()  # BOM，方便 Excel 识别 UTF-8
+    last_id = 0
+    while True:
+        batch = db.session.query(
+            GroupUser.id, GroupUser.tg_id, GroupUser.expiration_date, GroupUser.is_banned, GroupUser.profile_data
+        ).filter(GroupUser.group_id == group_id, GroupUser.id > last_id).order_by(GroupUser.id).limit(EXPORT_BATCH_SIZE).all()
+        if not batch:
+            break
+        buf = io.StringIO()
+        writer = csv.writer(buf) if fmt == 'csv' else None
+        for _, tg_id, expiration, banned, raw in batch:
+            try: profile = json.loads(raw) if raw else {}
+            except (ValueError, TypeError): profile = {}
+            expiration = expiration.strftime('%Y-%m-%d %H:%M:%S') if expiration else ''
+            if writer:
+                writer.writerow([tg_id, expiration, int(bool(banned))] + [profile.get(k, '') for k in keys])
+            else:
+                buf.write(json.dumps({'tg_id': tg_id, 'expiration_date': expiration or None,
+                                      'is_banned': bool(banned), 'profile': profile}, ensure_ascii=False) + '\n')
+        yield buf.getvalue()
+        last_id = batch[-1][0]
@@ -0,0 +1,116 @@
+from . import db
+from .models import GroupUser
+from sqlalchemy import bindparam, update
+import asyncio
+import threading
+
+CHECKIN_FLUSH_INTERVAL = 0.3  # Seconds between write-behind flushes
+CHECKIN_FLUSH_ROWS = 200  # Flush early once this many check-ins are pending
+
+# Core executemany：行已被删除时只是更新 0 行；ORM 按主键批量 UPDATE 会抛 StaleDataError 让整批反复重试
+_group_users = GroupUser.__table__
+_FLUSH_STMT = (
+    update(_group_users)
+    .where(_group_users.c.id == bindparam('b_id'))
+    .values(checkin_time=bindparam('b_time'), online=True)
+)
+
+class CheckinBuffer:
+    """
+    Write-behind buffer for check-ins.
+
+    A check-in is confirmed as soon as claim() records it in memory; the
+    pending rows are written as one batched UPDATE every
+    CHECKIN_FLUSH_INTERVAL seconds, when CHECKIN_FLUSH_ROWS are waiting, and
+    at shutdown. claim() also remembers every user checked in today, so a
+    repeat check-in is detected even while its first one is unwritten.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._day = None
+        self._checked = {}  # GroupUser.id -> checkin_time, today only
+        self._pending = {}  # GroupUser.id -> (group_id, checkin_time), not yet written
+        self._listeners = []
+        self._loop = None
+        self._wakeup = None
+        self.flushed = 0
+
+    def start(self, flask_app, run_db):
+        """Start the periodic flusher; must be called on the bot loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._flusher(flask_app, run_db))
+
+    def add_listener(self, fn):
+        """Call fn(group_ids) after each committed flush."""
+        self._listeners.append(fn)
+
+    def claim(self, user_id, group_id, now, today):
+        """Record today's check-in; False if the user already checked in today."""
+        with self._lock:
+            if self._day != today:
+                self._day = today
+                self._checked = {}
+            if user_id in self._checked:
+                return False
+            self._checked[user_id] = now
+            self._pending[user_id] = (group_id, now)
+            full = len(self._pending) >= CHECKIN_FLUSH_ROWS
+        if full and self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write pending check-ins in one transaction. Needs an app context."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                db.session.execute(_FLUSH_STMT, [{'b_id': uid, 'b_time': ts} for uid, (_, ts) in batch.items()])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # 写失败放回队列，下一轮重试（更新的打卡时间优先）
+                with self._lock:
+                    for uid, entry in batch.items():
+                        self._pending.setdefault(uid, entry)
+                raise
+            self.flushed += len(batch)
+            group_ids = {gid for gid, _ in batch.values()}
+            for fn in self._listeners:
+                fn(group_ids)
+            return len(batch)
+
+    async def _flusher(self, flask_app, run_db):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), CHECKIN_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            try:
+                await run_db(flask_app, self.flush)
+            except Exception as e:
+                print(f"❌ 打卡批量写入失败: {e}", flush=True)
+
+    def flush_on_exit(self, flask_app):
+        """atexit hook: write whatever is still pending."""
+        if not self._pending:
+            return
+        try:
+            with flask_app.app_context():
+                n = self.flush()
+            print(f"✅ 退出前已写入 {n} 条打卡", flush=True)
+        except Exception as e:
+            print(f"❌ 退出前打卡写入失败: {e}", flush=True)
+
+checkin_buffer = CheckinBuffer()
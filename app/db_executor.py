@@ -0,0 +1,60 @@
+from . import db, DB_POOL_SIZE
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import os
+
+# 可选：Bot 侧改用异步驱动（如 sqlite+aiosqlite:///bot.db、postgresql+asyncpg://...），Loop 只 await；未设置时走线程池
+BOT_ASYNC_DATABASE_URL = os.getenv('BOT_ASYNC_DATABASE_URL', '').strip()
+
+# Bot 侧所有同步 SQLAlchemy 工作都在这里跑，与连接池等大，避免线程空等连接
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='bot-db')
+
+_async_sessions = None  # async_sessionmaker once init_async_engine() succeeded
+
+def init_async_engine(url=BOT_ASYNC_DATABASE_URL):
+    """
+    Switch run_db to the async engine at `url`; False keeps the executor.
+
+    Needs SQLAlchemy's asyncio extra (greenlet) and the async driver named
+    in the URL. Call once on the bot loop, which then owns the pool.
+    """
+    global _async_sessions
+    if not url:
+        return False
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        engine = create_async_engine(url, pool_pre_ping=not url.startswith('sqlite'))
+    except ImportError as e:
+        print(f"⚠️ 异步数据库驱动不可用，继续使用 DB 线程池: {e}", flush=True)
+        return False
+    from .metrics import instrument_engine
+    instrument_engine(engine.sync_engine)
+    _async_sessions = async_sessionmaker(engine, expire_on_commit=False)
+    return True
+
+def _bound_unit(session, flask_app, fn, args):
+    with flask_app.app_context():
+        # 本单元内 db.session / Model.query 都落到异步引擎的会话上，应用上下文结束时关闭
+        db.session.registry.set(session)
+        return fn(*args)
+
+async def run_db(flask_app, fn, *args):
+    """
+    Run fn(*args) on the DB executor inside a Flask app context and await it.
+
+    Each call is one unit of work: the scoped session is removed when the
+    app context ends, so nothing leaks between updates. The caller's
+    contextvars are carried over so per-update metrics see the SQL it runs.
+    With the async engine enabled the same unit runs on the loop through
+    AsyncSession.run_sync, and only the driver's I/O is awaited.
+    """
+    if _async_sessions is not None:
+        async with _async_sessions() as session:
+            return await session.run_sync(_bound_unit, flask_app, fn, args)
+
+    def _unit():
+        with flask_app.app_context():
+            return fn(*args)
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, ctx.run, _unit)
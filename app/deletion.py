@@ -0,0 +1,120 @@
+from .outbound import outbound, PRIORITY_DELETE
+import asyncio
+import json
+import math
+import os
+import time
+
+WHEEL_SLOTS = 3600  # One slot per second; longer delays wait for later rounds
+DELETE_BATCH_SIZE = 100  # deleteMessages accepts up to 100 ids per call
+DELETION_STORE_PATH = os.getenv('DELETION_STORE_PATH', 'pending_deletions.json')
+
+class DeletionService:
+    """
+    Auto-deletion of bot replies on a timing wheel.
+
+    Each second the due message ids are grouped per chat and removed with
+    bulk deleteMessages calls. The pending set is snapshotted to
+    DELETION_STORE_PATH whenever it changes, so replies that fall due while
+    the process is down are still cleaned up after a restart.
+    """
+
+    def __init__(self, path=DELETION_STORE_PATH):
+        self.path = path
+        self._slots = [dict() for _ in range(WHEEL_SLOTS)]  # chat_id -> [(due, message_id)]
+        self._count = 0
+        self._dirty = False
+        self._bot = None
+        self.deleted = 0
+        self.failed = 0
+
+    def start(self, bot):
+        """Load persisted deletions and start ticking; must be called on the bot loop."""
+        self._bot = bot
+        for chat_id, message_id, due in self._read_store():
+            self._add(chat_id, message_id, due)
+        asyncio.get_running_loop().create_task(self._run())
+
+    def pending(self):
+        return self._count
+
+    def schedule(self, message, delay):
+        """Delete a sent Message after delay seconds. Bot loop only."""
+        if message is None or delay <= 0:
+            return
+        self._add(message.chat_id, message.message_id, time.time() + delay)
+        self._dirty = True
+
+    def _add(self, chat_id, message_id, due):
+        # 放进“到期那一秒”之后第一个被扫描的槽
+        slot = self._slots[math.ceil(due) % WHEEL_SLOTS]
+        slot.setdefault(chat_id, []).append((due, message_id))
+        self._count += 1
+
+    def _collect_due(self, second, now, due_by_chat):
+        slot = self._slots[second % WHEEL_SLOTS]
+        for chat_id in list(slot):
+            keep = []
+            for due, message_id in slot[chat_id]:
+                if due <= now:
+                    due_by_chat.setdefault(chat_id, []).append(message_id)
+                    self._count -= 1
+                else:
+                    keep.append((due, message_id))
+            if keep:
+                slot[chat_id] = keep
+            else:
+                del slot[chat_id]
+
+    async def _run(self):
+        last = int(time.time()) - WHEEL_SLOTS
+        # 启动时把整圈扫一遍，补上停机期间已到期的删除
+        while True:
+            now = time.time()
+            due_by_chat = {}
+            for second in range(max(last + 1, int(now) - WHEEL_SLOTS + 1), int(now) + 1):
+                self._collect_due(second, now, due_by_chat)
+            last = int(now)
+            for chat_id, ids in due_by_chat.items():
+                for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                    chunk = ids[i:i + DELETE_BATCH_SIZE]
+                    outbound.submit(PRIORITY_DELETE, None, self._bot.delete_messages, block_key=chat_id,
+                                    chat_id=chat_id, message_ids=chunk).add_done_callback(
+                        lambda f, n=len(chunk): self._done(f, n))
+            if due_by_chat:
+                self._dirty = True
+            if self._dirty:
+                self._dirty = False
+                snapshot = [[chat_id, message_id, due] for slot in self._slots
+                            for chat_id, entries in slot.items() for due, message_id in entries]
+                try:
+                    await asyncio.to_thread(self._write_store, snapshot)
+                except Exception as e:
+                    print(f"❌ 待删除消息保存失败: {e}", flush=True)
+            await asyncio.sleep(1 - (time.time() % 1))
+
+    def _done(self, future, n):
+        if future.cancelled() or future.exception():
+            self.failed += n
+            if not future.cancelled():
+                print(f"❌ 批量删除消息失败: {future.exception()}", flush=True)
+        else:
+            self.deleted += n
+
+    def _read_store(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return [tuple(e) for e in json.load(f)]
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"⚠️ 待删除消息读取失败: {e}", flush=True)
+            return []
+
+    def _write_store(self, snapshot):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path)
+
+deletion_service = DeletionService()
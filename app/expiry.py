@@ -0,0 +1,96 @@
+from . import db
+from .models import GroupUser
+from .services import get_beijing_now
+from datetime import timedelta
+import asyncio
+import heapq
+import threading
+
+EXPIRY_HORIZON = timedelta(hours=24)  # Only expirations this close are kept in memory
+EXPIRY_REFRESH_SECONDS = 3600  # Reload the heap from the database this often
+
+class ExpiryScheduler:
+    """
+    Fires the expired-user drain at the moment memberships expire.
+
+    Upcoming expiration times (Beijing naive datetimes, within
+    EXPIRY_HORIZON) sit in a min-heap; a task on the bot loop sleeps until the
+    earliest one passes and then runs the drain, which bans everything that
+    has expired by then. notify() adds times changed from the admin panel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._loop = None
+        self._wakeup = None
+
+    def start(self, flask_app, run_db, drain):
+        """Start the timer task; must be called on the bot loop. drain() returns a coroutine."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._run(flask_app, run_db, drain))
+
+    def pending(self):
+        return len(self._heap)
+
+    def notify(self, expiration_date):
+        """Schedule a (new) expiration time; callable from any thread."""
+        if not expiration_date or expiration_date - get_beijing_now() > EXPIRY_HORIZON:
+            return
+        with self._lock:
+            heapq.heappush(self._heap, expiration_date)
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _load(self):
+        """Upcoming expirations of unbanned users, within the horizon. Needs an app context."""
+        now = get_beijing_now()
+        rows = db.session.query(GroupUser.expiration_date).filter(
+            GroupUser.expiration_date.isnot(None),
+            GroupUser.expiration_date < now + EXPIRY_HORIZON,
+            GroupUser.is_banned == False
+        ).distinct().all()
+        return [r[0] for r in rows]
+
+    def _pop_due(self, now):
+        """Drop every due entry; True if any was due."""
+        due = False
+        with self._lock:
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+                due = True
+        return due
+
+    async def _run(self, flask_app, run_db, drain):
+        loop = asyncio.get_running_loop()
+        next_refresh = 0.0
+        while True:
+            if loop.time() >= next_refresh:
+                try:
+                    times = await run_db(flask_app, self._load)
+                    with self._lock:
+                        self._heap = times
+                        heapq.heapify(self._heap)
+                except Exception as e:
+                    print(f"❌ 过期调度加载失败: {e}", flush=True)
+                next_refresh = loop.time() + EXPIRY_REFRESH_SECONDS
+
+            if self._pop_due(get_beijing_now()):
+                try:
+                    await drain()
+                except Exception as e:
+                    print(f"❌ 过期封禁执行失败: {e}", flush=True)
+                continue
+
+            timeout = next_refresh - loop.time()
+            with self._lock:
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0] - get_beijing_now()).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0.0))
+            except asyncio.TimeoutError:
+                pass
+
+expiry_scheduler = ExpiryScheduler()
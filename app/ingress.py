@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+import time
+import traceback
+
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))  # Waiting updates before webhooks get 503
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 16))  # Updates processed concurrently
+
+class UpdateIngress:
+    """
+    Bounded queue between the webhook endpoints and the bot loop.
+
+    offer() may be called from Flask threads or from the loop itself. When
+    the queue is full it refuses the update, so the endpoint can answer 503
+    and let Telegram back off and redeliver. A fixed pool of consumer tasks
+    feeds accepted updates to the PTB application.
+    """
+
+    def __init__(self, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._loop = None
+        self._loop_thread = None
+        self._queue = None
+        self._ptb_app = None
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self, ptb_app):
+        """Start the consumers; must be called on the bot loop."""
+        self._ptb_app = ptb_app
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue = asyncio.Queue()
+        for _ in range(self.workers):
+            self._loop.create_task(self._worker())
+
+    @property
+    def ready(self):
+        return self._queue is not None
+
+    def offer(self, update):
+        """Enqueue an update from any thread. Returns False when full."""
+        with self._lock:
+            if self._queue is None or self._depth >= self.maxsize:
+                self.rejected += 1
+                return False
+            self._depth += 1
+            self.accepted += 1
+        item = (time.monotonic(), update)
+        if threading.get_ident() == self._loop_thread:
+            self._queue.put_nowait(item)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        return True
+
+    async def _worker(self):
+        while True:
+            enqueued_at, update = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            with self._lock:
+                self._depth -= 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+            self.in_flight += 1
+            try:
+                await self._ptb_app.process_update(update)
+            except Exception as exc:
+                print(f"❌ Webhook 异步任务异常:")
+                print(''.join(traceback.format_exception(type(exc), exc, exc.__traceback__)))
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+
+    def stats(self):
+        with self._lock:
+            started = self.accepted - self._depth
+            return {
+                'depth': self._depth,
+                'maxsize': self.maxsize,
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'processed': self.processed,
+                'avg_wait_ms': round(self.wait_total / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self.wait_max * 1000, 2),
+            }
+
+update_ingress = UpdateIngress()
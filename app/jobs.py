@@ -0,0 +1,77 @@
+from .outbound import outbound, PRIORITY_ADMIN
+import asyncio
+import secrets
+import threading
+import time
+
+JOB_CONCURRENCY = 4  # Telegram calls in flight per job; the outbound scheduler still rate-limits
+JOB_RETENTION_SECONDS = 3600  # Finished jobs stay pollable this long
+JOB_MAX_ERRORS = 50  # Errors kept per job
+
+class JobRegistry:
+    """
+    Progress of background jobs started from the admin panel.
+
+    A job is a list of Telegram calls run on the bot loop with at most
+    JOB_CONCURRENCY in flight; Flask routes create jobs and poll get().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def create(self, kind, total):
+        job_id = secrets.token_urlsafe(8)
+        now = time.time()
+        with self._lock:
+            for jid in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < now - JOB_RETENTION_SECONDS]:
+                del self._jobs[jid]
+            self._jobs[job_id] = {
+                'id': job_id, 'kind': kind, 'status': 'running', 'total': total,
+                'done': 0, 'failed': 0, 'errors': [], 'created_at': now, 'finished_at': None,
+            }
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, errors=list(job['errors'])) if job else None
+
+    def _progress(self, job_id, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            if error is None:
+                job['done'] += 1
+            else:
+                job['failed'] += 1
+                if len(job['errors']) < JOB_MAX_ERRORS:
+                    job['errors'].append(error)
+
+    def finish(self, job_id, status='done'):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = status
+            job['finished_at'] = time.time()
+
+    async def run(self, job_id, calls):
+        """Run [(label, func, kwargs)] through the outbound scheduler. Bot loop only."""
+        slots = asyncio.Semaphore(JOB_CONCURRENCY)
+
+        async def _one(label, func, kwargs):
+            async with slots:
+                try:
+                    await outbound.call(PRIORITY_ADMIN, None, func, block_key=kwargs.get('chat_id'), **kwargs)
+                    self._progress(job_id)
+                except Exception as e:
+                    self._progress(job_id, f"{label}: {e}")
+
+        try:
+            await asyncio.gather(*[_one(*c) for c in calls])
+        finally:
+            self.finish(job_id)
+
+    def start(self, loop, job_id, calls):
+        """Schedule run() on the bot loop from another thread."""
+        asyncio.run_coroutine_threadsafe(self.run(job_id, calls), loop)
+
+job_registry = JobRegistry()
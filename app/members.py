@@ -0,0 +1,56 @@
+from .models import GroupUser
+from . import db
+from collections import OrderedDict
+import threading
+
+MEMBER_CACHE_SIZE = 50000  # (group, user) membership answers kept for the auto-like check
+
+class MemberCache:
+    """
+    Recent membership answers per (group, user), for the auto-like check.
+
+    Members and non-members are both cached in one LRU, so chatter from
+    either never reaches the database twice. Every insert or delete of a
+    GroupUser must call forget() after its commit. A lookup that raced with
+    such a write is not cached (generation check).
+    """
+
+    def __init__(self, maxsize=MEMBER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._members = OrderedDict()  # (group_id, tg_id) -> is member, LRU order
+        self._generation = 0
+
+    def is_member(self, group_id, tg_id):
+        """Cached answer, or None when the database must be asked (lookup())."""
+        key = (group_id, tg_id)
+        with self._lock:
+            found = self._members.get(key)
+            if found is not None:
+                self._members.move_to_end(key)
+            return found
+
+    def lookup(self, group_id, tg_id):
+        """Check the database and remember the answer. Needs an app context."""
+        generation = self._generation
+        found = db.session.query(GroupUser.id).filter_by(group_id=group_id, tg_id=tg_id).first() is not None
+        with self._lock:
+            # 查询期间有增删则不写入，避免缓存过时的结果
+            if generation == self._generation:
+                self._members[(group_id, tg_id)] = found
+                while len(self._members) > self.maxsize:
+                    self._members.popitem(last=False)
+        return found
+
+    def forget(self, group_id, tg_ids=None):
+        """Drop answers for added or deleted users, or a whole group when tg_ids is None."""
+        with self._lock:
+            self._generation += 1
+            if tg_ids is None:
+                for key in [k for k in self._members if k[0] == group_id]:
+                    del self._members[key]
+            else:
+                for tg_id in tg_ids:
+                    self._members.pop((group_id, tg_id), None)
+
+member_cache = MemberCache()
@@ -0,0 +1,193 @@
+from .tracing import UpdateTrace, current_update, log_if_slow, profiler
+from telegram.request import HTTPXRequest
+from contextlib import contextmanager
+import bisect
+import functools
+import threading
+import time
+
+# 简易 Prometheus 文本格式指标：不引入额外依赖，/core/metrics 渲染
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+def _label_key(item):
+    # 标签值可能混有 int / str，按字符串排序，避免 render() 抛 TypeError
+    return tuple(str(v) for v in item[0])
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items(), key=_label_key):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, *labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, v in sorted(self._values.items(), key=_label_key):
+                cumulative = 0
+                for bound, n in zip(self.buckets, v):
+                    cumulative += n
+                    lines.append(f'{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_bucket{_labels(names, labels + ("+Inf",))} {v[-1]}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {round(v[-2], 6)}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {v[-1]}')
+        return lines
+
+class Callback:
+    """Gauge (or counter kept elsewhere) read from func() at scrape time."""
+
+    def __init__(self, name, help, func, kind='gauge'):
+        self.name, self.help, self.func, self.kind = name, help, func, kind
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', f'{self.name} {value}']
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def callback(self, name, help, func, kind='gauge'):
+        return self.register(Callback(name, help, func, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+HANDLER_LATENCY = metrics.histogram('bot_handler_seconds', 'Bot handler latency', ['handler'])
+HANDLER_ERRORS = metrics.counter('bot_handler_errors_total', 'Bot handler exceptions', ['handler'])
+UPDATE_DB_QUERIES = metrics.histogram('bot_update_db_queries', 'SQL statements executed per bot update', ['handler'], COUNT_BUCKETS)
+UPDATE_DB_SECONDS = metrics.histogram('bot_update_db_seconds', 'SQL time per bot update', ['handler'])
+DB_QUERIES = metrics.counter('db_queries_total', 'SQL statements executed')
+DB_QUERY_SECONDS = metrics.counter('db_query_seconds_total', 'Time spent executing SQL')
+TG_LATENCY = metrics.histogram('telegram_api_seconds', 'Telegram Bot API call latency', ['method'])
+TG_ERRORS = metrics.counter('telegram_api_errors_total', 'Telegram Bot API failures', ['method', 'code'])
+TG_RATE_LIMITED = metrics.counter('telegram_api_rate_limited_total', 'Telegram Bot API 429 responses', ['method'])
+
+@contextmanager
+def track_update(handler):
+    """Time one bot update, count the SQL it runs and log it when slow."""
+    trace = UpdateTrace(handler)
+    token = current_update.set(trace)
+    start = time.perf_counter()
+    try:
+        with profiler.capture(trace):
+            yield trace
+    except Exception:
+        HANDLER_ERRORS.inc(trace.handler)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        HANDLER_LATENCY.observe(trace.handler, value=elapsed)
+        UPDATE_DB_QUERIES.observe(trace.handler, value=trace.queries)
+        UPDATE_DB_SECONDS.observe(trace.handler, value=trace.db_seconds)
+        current_update.reset(token)
+        log_if_slow(trace, elapsed)
+
+def tracked(handler):
+    """Decorator for PTB callbacks: run each call under track_update(handler)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with track_update(handler):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_engine(engine):
+    """Count statements and their time via SQLAlchemy cursor events."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        DB_QUERIES.inc()
+        DB_QUERY_SECONDS.inc(amount=elapsed)
+        trace = current_update.get()
+        if trace is not None:
+            trace.queries += 1
+            trace.db_seconds += elapsed
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records latency, HTTP errors and 429s per Bot API method."""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data=request_data, **kwargs)
+        except Exception as e:
+            TG_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            TG_LATENCY.observe(api_method, value=time.perf_counter() - start)
+        if code == 429:
+            TG_RATE_LIMITED.inc(api_method)
+        elif code >= 400:
+            TG_ERRORS.inc(api_method, str(code))
+        return code, payload
@@ -0,0 +1,87 @@
+from . import db
+from .models import ProfileNgram, GroupUser, GroupDailyStats
+from .search import rebuild_profile_index
+from sqlalchemy import inspect, select, text
+from datetime import datetime
+
+# 版本化迁移：每个迁移只执行一次，已执行的版本记录在 schema_version 表
+# 新库先由 create_all 建出完整结构，迁移里的 DDL 都是幂等的
+
+def _add_missing_columns(conn):
+    """Columns added to the models after the first deployments."""
+    wanted = {
+        'bot_groups': [('last_query_msg_id', 'INTEGER')],
+        'group_users': [('expiration_date', 'TIMESTAMP'), ('is_banned', 'BOOLEAN DEFAULT FALSE')],
+    }
+    insp = inspect(conn)
+    for table, columns in wanted.items():
+        existing = {c['name'] for c in insp.get_columns(table)}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+def _index_online_checkin(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_group_users_online_checkin "
+        "ON group_users (group_id, online, checkin_time)"
+    ))
+
+def _index_expiry_pending(conn):
+    false = '0' if conn.dialect.name == 'sqlite' else 'false'
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_group_users_expiry_pending ON group_users (expiration_date) "
+        f"WHERE is_banned = {false} AND expiration_date IS NOT NULL"
+    ))
+
+def _backfill_profile_index(conn):
+    # 在迁移的同一事务里回填，与 schema_version 记录一起提交或回滚
+    has_index = conn.execute(select(ProfileNgram.__table__.c.id).limit(1)).first()
+    has_users = conn.execute(select(GroupUser.__table__.c.id).limit(1)).first()
+    if not has_index and has_users:
+        n = rebuild_profile_index(conn)
+        print(f"✅ [迁移] 资料搜索索引已回填 {n} 个用户", flush=True)
+
+def _create_daily_stats(conn):
+    GroupDailyStats.__table__.create(conn, checkfirst=True)
+
+def _refold_profile_index(conn):
+    # n-gram 改为不区分 ASCII 大小写，旧索引按新规则重建
+    if conn.execute(select(GroupUser.__table__.c.id).limit(1)).first():
+        n = rebuild_profile_index(conn)
+        print(f"✅ [迁移] 资料搜索索引已按新规则重建 {n} 个用户", flush=True)
+
+MIGRATIONS = [
+    (1, 'add legacy columns', _add_missing_columns),
+    (2, 'index group_users (group_id, online, checkin_time)', _index_online_checkin),
+    (3, 'partial index on unbanned group_users.expiration_date', _index_expiry_pending),
+    (4, 'backfill profile n-gram index', _backfill_profile_index),
+    (5, 'create group_daily_stats rollup table', _create_daily_stats),
+    (6, 'rebuild profile n-gram index case-folded', _refold_profile_index),
+]
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)"
+    ))
+
+def current_version():
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def run_migrations():
+    """Create missing tables, then apply pending migrations in order. Needs an app context."""
+    db.create_all()
+    applied = current_version()
+    for version, description, migrate in MIGRATIONS:
+        if version <= applied:
+            continue
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.now()}
+            )
+        print(f"✅ [迁移] v{version}: {description}", flush=True)
+    return max([applied] + [v for v, _, _ in MIGRATIONS])
@@ -20,15 +20,47 @@ class GroupUser(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('bot_groups.id'), index=True)
     tg_id = db.Column(db.BigInteger)
     profile_data = db.Column(db.Text, default='{}')
-    expiration_date = db.Column(db.DateTime, nullable=True)  # Consider adding composite index: (expiration_date, is_banned)
+    expiration_date = db.Column(db.DateTime, nullable=True)
     is_banned = db.Column(db.Boolean, default=False)
     checkin_time = db.Column(db.DateTime)
     online = db.Column(db.Boolean, default=False)
-    __table_args__ = (db.UniqueConstraint('group_id', 'tg_id', name='_group_user_uc'),)
+    # 索引与 app/migrations.py 中的迁移保持同名，新库由 create_all 直接建好
+    __table_args__ = (
+        db.UniqueConstraint('group_id', 'tg_id', name='_group_user_uc'),
+        # 查询热路径：group_id = ? AND online AND checkin_time >= 今日
+        db.Index('ix_group_users_online_checkin', 'group_id', 'online', 'checkin_time'),
+        # 过期扫描：只索引未封禁且有到期时间的行
+        db.Index('ix_group_users_expiry_pending', 'expiration_date',
+                 postgresql_where=db.text('is_banned = false AND expiration_date IS NOT NULL'),
+                 sqlite_where=db.text('is_banned = 0 AND expiration_date IS NOT NULL')),
+    )
     
     # Relationship to BotGroup for efficient querying
     group = db.relationship('BotGroup', backref='users', lazy=True)
 
+class ProfileNgram(db.Model):
+    """Character n-grams of profile field values, used as a keyword search index."""
+    __tablename__ = 'profile_ngrams'
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # GroupUser.id
+    field = db.Column(db.String(50), nullable=False)
+    gram = db.Column(db.String(8), nullable=False)
+    __table_args__ = (db.Index('ix_profile_ngrams_lookup', 'group_id', 'gram', 'user_id'),)
+
+class GroupDailyStats(db.Model):
+    """Per-group counters for one Beijing day, rewritten through the day by the stats rollup."""
+    __tablename__ = 'group_daily_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    registered = db.Column(db.Integer, default=0)
+    checked_in = db.Column(db.Integer, default=0)
+    banned = db.Column(db.Integer, default=0)
+    expiring = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime)
+    __table_args__ = (db.UniqueConstraint('group_id', 'day', name='_group_day_uc'),)
+
 class AuthSession(db.Model):
     __tablename__ = 'auth_sessions'
     id = db.Column(db.Integer, primary_key=True)
@@ -1,13 +1,32 @@
-from flask import Blueprint, render_template, request, redirect, session, jsonify
+from flask import Blueprint, render_template, request, redirect, session, jsonify, Response, stream_with_context, abort
 from app import db
-from app.models import BotGroup, GroupUser, DEFAULT_FIELDS, DEFAULT_SYSTEM, AuthSession
-from app.services import sanitize_html_for_telegram
+from app.models import BotGroup, GroupUser, DEFAULT_FIELDS, AuthSession
+from app.services import sanitize_html_for_telegram, get_group_conf, get_group_fields, get_beijing_now, get_beijing_today, template_fields, compile_template, render_plan
+from app.registry import group_registry
+from app.search import index_profile, unindex_users, keyword_filter
+from app.reactions import reaction_queue
+from app.webhook_server import WebhookServer
+from app.ingress import update_ingress
+from app.checkin_buffer import checkin_buffer
+from app.expiry import expiry_scheduler
+from app.deletion import deletion_service
+from app.page_cache import page_cache
+from app.roster import today_roster
+from app.snapshots import snapshot_store, QuerySnapshot
+from app.members import member_cache
+from app.bulk import import_users, export_users
+from app.jobs import job_registry
+from app.stats import group_stats, EXPIRING_SOON_DAYS
+from app.metrics import metrics, tracked, InstrumentedRequest
+from app.tracing import span, set_handler, profiler
+from app.db_executor import run_db, db_executor, init_async_engine
+from app.outbound import outbound, PRIORITY_CHECKIN, PRIORITY_QUERY, PRIORITY_ADMIN
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions, ChatMember
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, filters
+from sqlalchemy import and_, func, or_, update
 from sqlalchemy.orm import joinedload
-import os, jwt, time, json, asyncio, re, requests, math, secrets, string, hmac
+import os, jwt, time, json, asyncio, math, secrets, string, hmac, base64
 from datetime import datetime, timedelta
-import pytz
 
 core_bp = Blueprint('core', __name__, url_prefix='/core', template_folder='templates')
 
@@ -15,17 +34,14 @@ core_bp = Blueprint('core', __name__, url_prefix='/core', template_folder='templ
 global_ptb_app = None
 global_bot_loop = None
 global_flask_app = None  # 🆕 新增：持有 Flask App 实例
+global_webhook_server = None  # 原生 asyncio Webhook 监听（可选）
 
 # Constants
-EXPIRATION_CHECK_INTERVAL = 3600  # Check expired users every hour (in seconds)
+EXPIRATION_CHECK_INTERVAL = 3600  # Safety-net sweep interval; bans normally fire from the expiry scheduler (in seconds)
 JWT_TOKEN_EXPIRY_DAYS = 7  # JWT token validity for group access (in days)
-MAX_CONCURRENT_BANS = 5  # Maximum concurrent ban operations to avoid rate limits
-EXPIRED_USERS_BATCH_SIZE = 100  # Process expired users in batches to avoid memory issues
+EXPIRED_USERS_BATCH_SIZE = 100  # Expired users per keyset batch; batches repeat until none are left
 AUTH_SESSION_EXPIRY_MINUTES = 5  # Authentication session expiry time
 
-# Beijing timezone
-BEIJING_TZ = pytz.timezone('Asia/Shanghai')
-
 def generate_verification_code():
     """Generate a random 6-digit verification code"""
     return ''.join(secrets.choice(string.digits) for _ in range(6))
@@ -34,15 +50,6 @@ def generate_session_token():
     """Generate a secure random session token"""
     return secrets.token_urlsafe(32)
 
-def get_beijing_now():
-    """Get current time in Beijing timezone as naive datetime (for database storage)"""
-    return datetime.now(BEIJING_TZ).replace(tzinfo=None)
-
-def get_beijing_today():
-    """Get today's date at midnight in Beijing timezone as naive datetime"""
-    now = datetime.now(BEIJING_TZ)
-    return now.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
-
 async def is_user_admin_in_group(bot, chat_id, user_id):
     """Check if a user is an administrator in a specific group"""
     try:
@@ -55,25 +62,14 @@ async def is_user_admin_in_group(bot, chat_id, user_id):
 # --- Webhook ---
 @core_bp.route('/webhook', methods=['POST'])
 def webhook():
-    if not global_ptb_app or not global_bot_loop: return "Bot Not Ready", 503
+    if not global_ptb_app or not update_ingress.ready: return "Bot Not Ready", 503
     try:
         json_data = request.get_json(force=True)
         update = Update.de_json(json_data, global_ptb_app.bot)
         
-        # 添加 Future 回调以捕获异步任务中的异常
-        future = asyncio.run_coroutine_threadsafe(global_ptb_app.process_update(update), global_bot_loop)
-        
-        def check_future_exception(fut):
-            try:
-                exc = fut.exception()
-                if exc:
-                    import traceback
-                    print(f"❌ Webhook 异步任务异常:")
-                    print(''.join(traceback.format_exception(type(exc), exc, exc.__traceback__)))
-            except Exception as e:
-                print(f"❌ 回调函数本身异常: {e}")
-        
-        future.add_done_callback(check_future_exception)
+        # 有界队列：积压满了返回 503，让 Telegram 退避后重投
+        if not update_ingress.offer(update):
+            return "Busy", 503
         return "OK", 200
     except Exception as e:
         print(f"❌ Webhook Error: {e}")
@@ -82,36 +78,29 @@ def webhook():
 # --- Context ---
 @core_bp.context_processor
 def inject_context():
+    # 群组列表与当前群组走注册表缓存，群组有写入时按版本失效
     data = {'all_groups': []}
     if session.get('logged_in'):
-        data['all_groups'] = BotGroup.query.order_by(BotGroup.is_active.desc(), BotGroup.updated_at.desc()).all()
+        data['all_groups'] = group_registry.admin_groups()
     gid = session.get('current_group_id')
-    if gid: data['current_group'] = BotGroup.query.get(gid)
+    if gid: data['current_group'] = group_registry.admin_group(gid)
     return data
 
+@core_bp.after_request
+def add_etag(response):
+    """ETag / If-None-Match for admin JSON GETs: unchanged polls get an empty 304."""
+    if request.method == 'GET' and response.status_code == 200 and response.mimetype == 'application/json':
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    return response
+
 def safe_int(val, default=0):
     if val is None: return default
     if isinstance(val, str) and val.strip() == '': return default
     try: return int(val)
     except: return default
 
-def get_group_conf(group):
-    conf = DEFAULT_SYSTEM.copy()
-    if group and group.config:
-        try:
-            c = json.loads(group.config)
-            if isinstance(c, dict) and 'config' in c: c = c['config']
-            for k, v in c.items():
-                if v is not None: conf[k] = v
-        except: pass
-    return conf
-
-def get_group_fields(group):
-    if group and group.fields_config:
-        try: return json.loads(group.fields_config)
-        except: pass
-    return DEFAULT_FIELDS
-
 # --- Web Routes ---
 @core_bp.route('/')
 def index(): return redirect('/core/select_group') if session.get('logged_in') else render_template('base.html', page='login')
@@ -120,27 +109,27 @@ def index(): return redirect('/core/select_group') if session.get('logged_in') e
 def page_select_group():
     if not session.get('logged_in'): return redirect('/core')
     session.pop('current_group_id', None)
-    groups = BotGroup.query.order_by(BotGroup.is_active.desc(), BotGroup.updated_at.desc()).all()
+    groups = group_registry.admin_groups()
     return render_template('select_group.html', groups=groups)
 
 @core_bp.route('/group/<int:gid>/dashboard')
 def page_dashboard(gid):
     if not session.get('logged_in'): return redirect('/core')
     session['current_group_id'] = gid
-    group = BotGroup.query.get_or_404(gid)
-    stats = {'users': GroupUser.query.filter_by(group_id=gid).count(), 'online': GroupUser.query.filter_by(group_id=gid, online=True).count()}
+    group = group_registry.admin_group(gid)
+    if not group: abort(404)
+    # 计数器常驻内存，只在首次访问或过期窗口刷新时查库
+    stats = group_stats.get(gid)
     return render_template('dashboard.html', page='dashboard', group=group, stats=stats)
 
 @core_bp.route('/group/<int:gid>/users')
 def page_users(gid):
     if not session.get('logged_in'): return redirect('/core')
     session['current_group_id'] = gid
-    group = BotGroup.query.get_or_404(gid)
-    users = GroupUser.query.filter_by(group_id=gid).order_by(GroupUser.id.desc()).limit(200).all()
-    for u in users:
-        try: u.profile_dict = json.loads(u.profile_data) if u.profile_data else {}
-        except: u.profile_dict = {}
-    return render_template('users.html', page='users', group=group, users=users, fields=get_group_fields(group))
+    group = group_registry.admin_group(gid)
+    if not group: abort(404)
+    # 用户列表由页面通过 /core/api/users 按需分页加载
+    return render_template('users.html', page='users', group=group, fields=group_registry.get(group.chat_id).fields)
 
 @core_bp.route('/group/<int:gid>/fields')
 def page_fields(gid):
@@ -176,7 +165,9 @@ def api_toggle_group():
     g = BotGroup.query.get(group_id)
     if not g: return jsonify({'status':'error','msg':'Group not found'})
     
+    chat_id = g.chat_id
     if d['action'] == 'delete':
+        unindex_users(group_id=g.id)
         GroupUser.query.filter_by(group_id=g.id).delete()
         db.session.delete(g)
     elif d['action'] == 'toggle':
@@ -185,6 +176,11 @@ def api_toggle_group():
         return jsonify({'status':'error','msg':'Invalid action'})
     
     db.session.commit()
+    group_registry.invalidate(chat_id)
+    if d['action'] == 'delete':
+        today_roster.remove(group_id)
+        member_cache.forget(group_id)
+        group_stats.invalidate(group_id)
     return jsonify({'status':'ok'})
 
 @core_bp.route('/api/save_fields', methods=['POST'])
@@ -197,6 +193,7 @@ def api_save_fields():
     
     group.fields_config = json.dumps(fields_data, ensure_ascii=False)
     db.session.commit()
+    group_registry.invalidate(group.chat_id)
     return jsonify({'status':'ok'})
 
 @core_bp.route('/api/save_settings', methods=['POST'])
@@ -206,6 +203,8 @@ def api_save_settings():
     group = BotGroup.query.get(d['group_id'])
     group.config = json.dumps(d['config'], ensure_ascii=False)
     db.session.commit()
+    group_registry.invalidate(group.chat_id)
+    page_cache.invalidate(group.id)
     return jsonify({'status':'ok'})
 
 @core_bp.route('/api/save_user', methods=['POST'])
@@ -217,38 +216,222 @@ def api_save_user():
     if not uid: return jsonify({'status':'error','msg':'No ID'})
     
     u = GroupUser.query.filter_by(group_id=gid, tg_id=uid).first()
-    if not u:
+    created = u is None
+    if created:
         u = GroupUser(group_id=gid, tg_id=uid)
         db.session.add(u)
     
     u.profile_data = json.dumps(d['profile'], ensure_ascii=False)
+    db.session.flush()
+    index_profile(u.group_id, u.id, d['profile'])
     add = safe_int(d.get('add_days'))
+    unban = False
     if add != 0:
         base = u.expiration_date or get_beijing_now()
         u.expiration_date = base + timedelta(days=add)
         if add > 0 and u.is_banned:
             u.is_banned = False
-            try: 
-                group = BotGroup.query.get(gid)
-                asyncio.run_coroutine_threadsafe(
-                    global_ptb_app.bot.restrict_chat_member(
-                        chat_id=group.chat_id,
-                        user_id=u.tg_id,
-                        permissions=ChatPermissions.all_permissions()
-                    ),
-                    global_bot_loop
-                ).result(timeout=5)
-            except Exception as e:
-                print(f"Failed to unban user: {e}")
+            unban = True
 
     db.session.commit()
+    group_stats.adjust(u.group_id, registered=int(created), banned=-int(unban))
+    if created:
+        # 新成员：清掉之前缓存的"非成员"结果
+        member_cache.forget(u.group_id, [u.tg_id])
+    if unban:
+        # 解禁交给机器人出站队列异步执行，不阻塞 Flask 线程
+        try:
+            group = BotGroup.query.get(gid)
+            outbound.post_threadsafe(
+                PRIORITY_ADMIN, None, global_ptb_app.bot.restrict_chat_member, block_key=group.chat_id,
+                chat_id=group.chat_id,
+                user_id=u.tg_id,
+                permissions=ChatPermissions.all_permissions()
+            )
+        except Exception as e:
+            print(f"Failed to unban user: {e}")
+    page_cache.invalidate(u.group_id)
+    today_roster.profile_changed(u.group_id, u.id, d['profile'])
+    if add != 0:
+        # 到期时间变了，让过期调度器按新时间准点触发
+        expiry_scheduler.notify(u.expiration_date)
+        group_stats.expiry_changed()
     return jsonify({'status':'ok'})
 
+BULK_MAX_USERS = 5000  # tg_ids per bulk request
+BULK_OPS = ('extend', 'set_expiry', 'ban', 'unban', 'delete')
+
+@core_bp.route('/api/bulk_users', methods=['POST'])
+def api_bulk_users():
+    """
+    Apply one membership operation to many users of a group.
+
+    Body: group_id, tg_ids, op (extend|set_expiry|ban|unban|delete), plus
+    days for extend or expiration_date (YYYY-MM-DD[ HH:MM]) for set_expiry.
+    The DB change is one transaction; the Telegram restrictions run as a
+    background job whose id is returned for /api/jobs/<job_id>.
+    """
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    d = request.json or {}
+    op = d.get('op')
+    group = BotGroup.query.get(safe_int(d.get('group_id')))
+    if not group: return jsonify({'status':'error', 'msg':'Group not found'})
+    if op not in BULK_OPS: return jsonify({'status':'error', 'msg':'Invalid operation'})
+    tg_ids = list({safe_int(t) for t in d.get('tg_ids') or []} - {0})
+    if not tg_ids: return jsonify({'status':'error', 'msg':'No ID'})
+    if len(tg_ids) > BULK_MAX_USERS: return jsonify({'status':'error', 'msg':f'一次最多操作 {BULK_MAX_USERS} 个用户'})
+
+    days, new_expiry = 0, None
+    if op == 'extend':
+        days = safe_int(d.get('days'))
+        if not days: return jsonify({'status':'error', 'msg':'Invalid days'})
+    elif op == 'set_expiry':
+        try: new_expiry = datetime.strptime(str(d.get('expiration_date', '')).strip(), '%Y-%m-%d %H:%M')
+        except ValueError:
+            try: new_expiry = datetime.strptime(str(d.get('expiration_date', '')).strip(), '%Y-%m-%d')
+            except ValueError: return jsonify({'status':'error', 'msg':'Invalid expiration_date'})
+
+    rows = db.session.query(GroupUser.id, GroupUser.tg_id, GroupUser.expiration_date, GroupUser.is_banned).filter(
+        GroupUser.group_id == group.id, GroupUser.tg_id.in_(tg_ids)
+    ).all()
+    now = get_beijing_now()
+    changes, restrict, unrestrict = [], [], []
+    for uid, tg_id, expiration, banned in rows:
+        if op == 'extend':
+            expiration = (expiration or now) + timedelta(days=days)
+            # 与单个续期一致：延长时顺带解禁
+            if days > 0 and banned: unrestrict.append(tg_id)
+            changes.append({'id': uid, 'expiration_date': expiration, 'is_banned': banned and days <= 0})
+        elif op == 'set_expiry':
+            if banned and new_expiry > now: unrestrict.append(tg_id)
+            changes.append({'id': uid, 'expiration_date': new_expiry, 'is_banned': banned and new_expiry <= now})
+        elif op == 'ban':
+            if not banned: restrict.append(tg_id)
+            changes.append({'id': uid, 'is_banned': True})
+        elif op == 'unban':
+            if banned: unrestrict.append(tg_id)
+            changes.append({'id': uid, 'is_banned': False})
+
+    user_ids = [r[0] for r in rows]
+    try:
+        if op == 'delete':
+            unindex_users(user_ids=user_ids)
+            GroupUser.query.filter(GroupUser.id.in_(user_ids)).delete(synchronize_session=False)
+        elif changes:
+            db.session.execute(update(GroupUser), changes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status':'error', 'msg':f'操作失败: {e}'})
+
+    page_cache.invalidate(group.id)
+    if op == 'delete':
+        for uid in user_ids: today_roster.remove(group.id, uid)
+        member_cache.forget(group.id, [r[1] for r in rows])
+        group_stats.adjust(group.id, registered=-len(rows), banned=-sum(1 for r in rows if r[3]))
+    else:
+        group_stats.adjust(group.id, banned=len(restrict) - len(unrestrict))
+    group_stats.expiry_changed()
+    for expiration in {c['expiration_date'] for c in changes if c.get('expiration_date')}:
+        expiry_scheduler.notify(expiration)
+
+    # Telegram 侧的禁言/解禁作为后台任务，经出站队列限速执行
+    permissions = [(t, ChatPermissions(can_send_messages=False), "禁言") for t in restrict]
+    permissions += [(t, ChatPermissions.all_permissions(), "解禁") for t in unrestrict]
+    job_id = job_registry.create(op, len(permissions))
+    if not permissions:
+        job_registry.finish(job_id)
+    elif not global_ptb_app or not global_bot_loop:
+        job_registry.finish(job_id, 'failed')
+    else:
+        job_registry.start(global_bot_loop, job_id, [
+            (f"{label} {t}", global_ptb_app.bot.restrict_chat_member,
+             {'chat_id': group.chat_id, 'user_id': t, 'permissions': perms})
+            for t, perms, label in permissions
+        ])
+    return jsonify({'status':'ok', 'updated': len(rows), 'missing': len(tg_ids) - len(rows), 'job_id': job_id})
+
+@core_bp.route('/api/stats_history')
+def api_stats_history():
+    """Daily counters of the current group from the rollup table"""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    gid = session.get('current_group_id')
+    if not gid: return jsonify({'status':'error', 'msg':'Missing parameters'})
+    days = min(max(safe_int(request.args.get('days'), 30), 1), 366)
+    return jsonify({'status':'ok', 'history': group_stats.history(gid, days)})
+
+@core_bp.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    job = job_registry.get(job_id)
+    if not job: return jsonify({'status':'error', 'msg':'Job not found'})
+    return jsonify({'status':'ok', 'job': job})
+
+@core_bp.route('/api/import_users', methods=['POST'])
+def api_import_users():
+    """Stream a CSV/JSONL upload into the current group; rows are upserted by (group_id, tg_id)."""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    gid = session.get('current_group_id')
+    upload = request.files.get('file')
+    if not gid or not upload:
+        return jsonify({'status':'error', 'msg':'Missing parameters'})
+    fmt = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'status':'error', 'msg':'仅支持 CSV 或 JSONL 文件'})
+    group = BotGroup.query.get(gid)
+    if not group:
+        return jsonify({'status':'error', 'msg':'Group not found'})
+
+    def _after_chunk(saved):
+        # 每块提交后同步内存名单与过期调度
+        for uid, r in saved.items():
+            today_roster.profile_changed(gid, uid, r['profile'])
+        member_cache.forget(group.id, [r['tg_id'] for r in saved.values()])
+        for expiration in {r['expiration_date'] for r in saved.values() if r['expiration_date']}:
+            expiry_scheduler.notify(expiration)
+
+    try:
+        imported, errors = import_users(gid, get_group_fields(group), upload.stream, fmt, on_chunk=_after_chunk)
+    except Exception as e:
+        return jsonify({'status':'error', 'msg':f'导入失败: {e}'})
+    finally:
+        page_cache.invalidate(gid)
+        group_stats.invalidate(gid)
+    return jsonify({'status':'ok', 'imported': imported, 'errors': errors})
+
+@core_bp.route('/api/export_users')
+def api_export_users():
+    """Stream the current group's users as CSV or JSONL."""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    gid = session.get('current_group_id')
+    fmt = request.args.get('format', 'csv')
+    if not gid or fmt not in ('csv', 'jsonl'):
+        return jsonify({'status':'error', 'msg':'Missing parameters'})
+    group = BotGroup.query.get(gid)
+    if not group:
+        return jsonify({'status':'error', 'msg':'Group not found'})
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(export_users(gid, get_group_fields(group), fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=group_{gid}_users.{fmt}'}
+    )
+
 @core_bp.route('/api/delete_user', methods=['POST'])
 def api_delete_user():
     if not session.get('logged_in'): return jsonify({'status':'error'})
-    GroupUser.query.filter_by(id=request.json['id']).delete()
+    uid = request.json['id']
+    u = GroupUser.query.get(uid)
+    if not u: return jsonify({'status':'ok'})
+    group_id, user_id, tg_id, banned = u.group_id, u.id, u.tg_id, u.is_banned
+    unindex_users(user_ids=[uid])
+    GroupUser.query.filter_by(id=uid).delete()
     db.session.commit()
+    page_cache.invalidate(group_id)
+    today_roster.remove(group_id, user_id)
+    member_cache.forget(group_id, [tg_id])
+    group_stats.adjust(group_id, registered=-1, banned=-int(bool(banned)))
+    group_stats.expiry_changed()
     return jsonify({'status':'ok'})
 
 @core_bp.route('/api/search_users', methods=['POST'])
@@ -269,13 +452,20 @@ def api_search_users():
     
     # Search users by keyword in profile_data
     # Requirement: "所有的查询只显示已经今日打卡的认证用户" (ALL queries should only show users who checked in today)
-    today = get_beijing_today()
-    users = GroupUser.query.filter(
-        GroupUser.group_id == gid,
-        GroupUser.online == True,
-        GroupUser.checkin_time >= today,
-        GroupUser.profile_data.contains(keyword)
-    ).order_by(GroupUser.id.desc()).limit(200).all()
+    entries = today_roster.select(gid, keyword)
+    if entries is not None:
+        # 名单在内存里筛选，只按主键取封禁/到期字段
+        ids = [e.user_id for e in entries[:200]]
+        by_id = {u.id: u for u in GroupUser.query.filter(GroupUser.id.in_(ids)).all()} if ids else {}
+        users = [by_id[i] for i in ids if i in by_id]
+    else:
+        today = get_beijing_today()
+        users = GroupUser.query.filter(
+            GroupUser.group_id == gid,
+            GroupUser.online == True,
+            GroupUser.checkin_time >= today,
+            *keyword_filter(gid, keyword)
+        ).order_by(GroupUser.id.desc()).limit(200).all()
     
     result_users = []
     for u in users:
@@ -299,6 +489,116 @@ def api_search_users():
     })
 
 
+USER_LIST_PAGE_SIZE = 50  # Default rows per /api/users page
+USER_LIST_MAX_PAGE_SIZE = 200
+USER_LIST_COLUMNS = {
+    'tg_id': GroupUser.tg_id,
+    'profile': GroupUser.profile_data,
+    'is_banned': GroupUser.is_banned,
+    'online': GroupUser.online,
+    'checkin_time': GroupUser.checkin_time,
+    'expiration_date': GroupUser.expiration_date,
+}
+USER_LIST_SORTS = {'id': GroupUser.id, 'expiration_date': GroupUser.expiration_date, 'checkin_time': GroupUser.checkin_time}
+
+def _encode_cursor(value, last_id):
+    if isinstance(value, datetime): value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode()
+
+def _decode_cursor(cursor, is_datetime):
+    value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if value is not None and is_datetime: value = datetime.fromisoformat(value)
+    return value, int(last_id)
+
+def _keyset_after(col, value, last_id, desc):
+    """Rows after (value, last_id) in ORDER BY col NULLS LAST, id."""
+    id_after = GroupUser.id < last_id if desc else GroupUser.id > last_id
+    if col is GroupUser.id:
+        return id_after
+    if value is None:
+        return and_(col.is_(None), id_after)
+    beyond = col < value if desc else col > value
+    return or_(beyond, and_(col == value, id_after), col.is_(None))
+
+@core_bp.route('/api/users')
+def api_users():
+    """
+    Keyset-paginated user list of the current group.
+
+    Query args: cursor, limit, sort (id|expiration_date|checkin_time),
+    order (asc|desc), keyword, banned (1|0), expiry (expired|soon|permanent|valid),
+    checkin (today|absent|YYYY-MM-DD) and fields (comma separated columns).
+    """
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    gid = session.get('current_group_id')
+    if not gid: return jsonify({'status':'error', 'msg':'Missing parameters'})
+    args = request.args
+
+    sort = args.get('sort', 'id')
+    if sort not in USER_LIST_SORTS: return jsonify({'status':'error', 'msg':'Invalid sort'})
+    col = USER_LIST_SORTS[sort]
+    desc = args.get('order', 'desc') != 'asc'
+    names = [f for f in args.get('fields', '').split(',') if f] or list(USER_LIST_COLUMNS)
+    if any(f not in USER_LIST_COLUMNS for f in names): return jsonify({'status':'error', 'msg':'Invalid fields'})
+    limit = min(max(safe_int(args.get('limit'), USER_LIST_PAGE_SIZE), 1), USER_LIST_MAX_PAGE_SIZE)
+
+    q = db.session.query(GroupUser.id, col, *[USER_LIST_COLUMNS[f] for f in names]).filter(GroupUser.group_id == gid)
+
+    now, today = get_beijing_now(), get_beijing_today()
+    banned = args.get('banned')
+    if banned in ('1', '0'):
+        q = q.filter(GroupUser.is_banned == (banned == '1'))
+    expiry = args.get('expiry')
+    if expiry == 'expired':
+        q = q.filter(GroupUser.expiration_date < now)
+    elif expiry == 'soon':
+        q = q.filter(GroupUser.expiration_date >= now, GroupUser.expiration_date < now + timedelta(days=EXPIRING_SOON_DAYS))
+    elif expiry == 'permanent':
+        q = q.filter(GroupUser.expiration_date.is_(None))
+    elif expiry == 'valid':
+        q = q.filter(or_(GroupUser.expiration_date.is_(None), GroupUser.expiration_date >= now))
+    checkin = args.get('checkin')
+    if checkin == 'today':
+        q = q.filter(GroupUser.checkin_time >= today)
+    elif checkin == 'absent':
+        q = q.filter(or_(GroupUser.checkin_time.is_(None), GroupUser.checkin_time < today))
+    elif checkin:
+        try: day = datetime.strptime(checkin, '%Y-%m-%d')
+        except ValueError: return jsonify({'status':'error', 'msg':'Invalid checkin date'})
+        q = q.filter(GroupUser.checkin_time >= day, GroupUser.checkin_time < day + timedelta(days=1))
+    keyword = args.get('keyword', '').strip()
+    if keyword:
+        by_profile = and_(*keyword_filter(gid, keyword))
+        # isdigit() 也认 '²'、'١' 等 Unicode 数字，只有 ASCII 数字且在 BIGINT 范围内才按 tg_id 匹配
+        tg_id = int(keyword) if keyword.isascii() and keyword.isdigit() else None
+        q = q.filter(or_(GroupUser.tg_id == tg_id, by_profile) if tg_id is not None and tg_id < 2 ** 63 else by_profile)
+
+    cursor = args.get('cursor')
+    if cursor:
+        try: value, last_id = _decode_cursor(cursor, col is not GroupUser.id)
+        except (ValueError, TypeError): return jsonify({'status':'error', 'msg':'Invalid cursor'})
+        q = q.filter(_keyset_after(col, value, last_id, desc))
+
+    if col is GroupUser.id:
+        order = [GroupUser.id.desc() if desc else GroupUser.id.asc()]
+    else:
+        order = [(col.desc() if desc else col.asc()).nullslast(), GroupUser.id.desc() if desc else GroupUser.id.asc()]
+    rows = q.order_by(*order).limit(limit + 1).all()
+
+    users = []
+    for row in rows[:limit]:
+        u = {'id': row[0]}
+        for name, value in zip(names, row[2:]):
+            if name == 'profile':
+                try: value = json.loads(value) if value else {}
+                except (ValueError, TypeError): value = {}
+            elif isinstance(value, datetime):
+                value = value.strftime('%Y-%m-%d %H:%M:%S')
+            u[name] = value
+        users.append(u)
+    next_cursor = _encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return jsonify({'status': 'ok', 'users': users, 'next_cursor': next_cursor})
+
 @core_bp.route('/api/push_user', methods=['POST'])
 def api_push_user():
     if not session.get('logged_in'): return jsonify({'status':'error'})
@@ -313,23 +613,14 @@ def api_push_user():
         if not cid: return jsonify({'status':'error','msg':'请先在功能配置中填写推送频道ID'})
         
         tpl = conf.get('push_template', '用户: {tg_id}')
-        text = tpl.replace('{tg_id}', str(user.tg_id)).replace('{onlineEmoji}', '🟢' if user.online else '🔴').replace('{序号}', str(user.id))
-        
+        plan = compile_template(tpl, template_fields(get_group_fields(group)), keep_unknown=True)
         p = json.loads(user.profile_data or '{}')
-        for k,v in p.items(): text = text.replace(f'{{{k}}}', str(v)) 
-        
-        fields = get_group_fields(group)
-        for f in fields:
-            val = p.get(f['key'], '')
-            text = text.replace(f"{{{f['label']}}}", str(val))
+        text = render_plan(plan, p, tg_id=user.tg_id, seq=user.id, emoji='🟢' if user.online else '🔴')
 
         # Sanitize HTML before sending to Telegram
         text = sanitize_html_for_telegram(text)
 
-        asyncio.run_coroutine_threadsafe(
-            global_ptb_app.bot.send_message(chat_id=cid, text=text, parse_mode='HTML'),
-            global_bot_loop
-        )
+        outbound.post_threadsafe(PRIORITY_ADMIN, cid, global_ptb_app.bot.send_message, chat_id=cid, text=text, parse_mode='HTML')
         return jsonify({'status':'ok'})
     except Exception as e:
         return jsonify({'status':'error','msg':str(e)})
@@ -425,6 +716,64 @@ def api_check_auth_status():
         return jsonify({'status': 'verified', 'redirect_url': '/core/select_group'})
 
 
+@core_bp.route('/api/runtime_stats')
+def api_runtime_stats():
+    """Webhook ingress queue stats and query page cache hit/miss counts"""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    return jsonify({'status': 'ok', 'ingress': update_ingress.stats(), 'page_cache': page_cache.stats()})
+
+# --- Metrics ---
+metrics.callback('db_executor_queue_depth', 'DB work items waiting for an executor thread', lambda: db_executor._work_queue.qsize())
+metrics.callback('outbound_queue_depth', 'Telegram calls waiting in the outbound scheduler', outbound.qsize)
+metrics.callback('auto_delete_pending', 'Messages scheduled for auto-deletion', deletion_service.pending)
+metrics.callback('checkin_buffer_pending', 'Check-ins not yet written to the database', checkin_buffer.pending_count)
+metrics.callback('expiry_pending', 'Expirations waiting in the ban scheduler', expiry_scheduler.pending)
+metrics.callback('ingress_queue_depth', 'Webhook updates waiting for a worker', lambda: update_ingress.stats()['depth'])
+metrics.callback('webhook_updates_accepted_total', 'Webhook updates queued', lambda: update_ingress.stats()['accepted'], 'counter')
+metrics.callback('webhook_updates_rejected_total', 'Webhook updates refused with 503 (queue full)', lambda: update_ingress.stats()['rejected'], 'counter')
+metrics.callback('query_page_cache_hits_total', 'Query page cache hits', lambda: page_cache.stats()['hits'], 'counter')
+metrics.callback('query_page_cache_misses_total', 'Query page cache misses', lambda: page_cache.stats()['misses'], 'counter')
+
+@core_bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition. Needs METRICS_TOKEN as a bearer token, or an admin session when unset."""
+    token = os.getenv('METRICS_TOKEN', '')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        given = auth[7:] if auth.startswith('Bearer ') else request.args.get('token', '')
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return "Unauthorized", 401
+    elif not session.get('logged_in'):
+        return "Unauthorized", 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@core_bp.route('/api/profiling', methods=['GET', 'POST'])
+def api_profiling():
+    """Arm cProfile / tracemalloc capture for the next N bot updates (mode 'off' stops it)"""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode')
+        if mode == 'off':
+            profiler.arm(None, 0)
+        elif mode in profiler.MODES:
+            profiler.arm(mode, safe_int(data.get('updates'), 10))
+        else:
+            return jsonify({'status': 'error', 'msg': '未知的采样模式'})
+    return jsonify({'status': 'ok', 'profiling': profiler.status()})
+
+@core_bp.route('/api/profiling/download')
+def api_profiling_download():
+    """Captured profile as a text report, or ?format=prof for raw cProfile stats"""
+    if not session.get('logged_in'): return jsonify({'status':'error'})
+    if request.args.get('format') == 'prof':
+        data = profiler.dump()
+        if data is None: return jsonify({'status': 'error', 'msg': '没有 cProfile 采样结果'})
+        return Response(data, mimetype='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename=bot.prof'})
+    return Response(profiler.report(), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=bot-profile.txt'})
+
 @core_bp.route('/logout')
 def logout():
     session.clear()
@@ -434,102 +783,125 @@ def logout():
 # 🤖 机器人逻辑 (核心)
 # =======================
 
-async def check_expired_users(context):
+def _expired_users_query(now, after=None):
+    """
+    Unbanned users expired before `now`, in (expiration_date, id) order after
+    the keyset cursor `after`. The order follows ix_group_users_expiry_pending,
+    so the partial index drives the scan.
+    """
+    q = GroupUser.query.options(joinedload(GroupUser.group)).filter(
+        GroupUser.expiration_date.isnot(None),
+        GroupUser.expiration_date < now,
+        GroupUser.is_banned == False
+    )
+    if after is not None:
+        exp, last_id = after
+        q = q.filter(or_(GroupUser.expiration_date > exp, and_(GroupUser.expiration_date == exp, GroupUser.id > last_id)))
+    return q.order_by(GroupUser.expiration_date, GroupUser.id)
+
+def _ban_expired_batch(after=None):
+    """
+    Mark one keyset page of expired users as banned.
+    Returns (users_to_ban, cursor); cursor is None when nothing is left.
+    """
+    try:
+        now = get_beijing_now()
+        expired_users = _expired_users_query(now, after).limit(EXPIRED_USERS_BATCH_SIZE).all()
+        if not expired_users:
+            return [], None
+        
+        print(f"🔍 Found {len(expired_users)} expired users to ban (batch limit: {EXPIRED_USERS_BATCH_SIZE})", flush=True)
+        
+        # Collect plain values: ORM objects are detached once the unit of work ends
+        users_to_ban = []
+        banned_groups = []
+        for user in expired_users:
+            if user.group and user.group.is_active:
+                conf = get_group_conf(user.group)
+                ban_msg = conf.get('msg_expired_ban', '⛔️ <b>您的认证已过期，已被暂时禁言。请联系管理员续费。</b>')
+                users_to_ban.append((user.tg_id, user.group.chat_id, user.group.title, ban_msg))
+                banned_groups.append(user.group_id)
+                user.is_banned = True
+        # 停用群的用户不会被封禁，游标跳过它们
+        cursor = (expired_users[-1].expiration_date, expired_users[-1].id)
+        
+        # Commit the whole batch at once
+        db.session.commit()
+        for gid in banned_groups:
+            group_stats.adjust(gid, banned=1)
+        if users_to_ban:
+            print(f"✅ Marked {len(users_to_ban)} users as banned in database", flush=True)
+        return users_to_ban, cursor
+    except Exception as e:
+        print(f"Error in check_expired_users sync part: {e}")
+        db.session.rollback()
+        return [], None
+
+_expiry_drain_lock = asyncio.Lock()
+
+async def drain_expired_users(bot):
     """
-    Periodic job to check for expired users and mute them in groups
+    Ban every user whose membership has expired, batch by batch (keyset on
+    expiration_date, id) until none are left. Triggered by the expiry scheduler at
+    the moment of expiry and by the periodic safety-net job.
     """
     if not global_flask_app:
         return
     
-    def _sync_check():
-        with global_flask_app.app_context():
-            try:
-                now = get_beijing_now()
-                # Find expired users with a limit to avoid memory issues
-                # Process in batches for large datasets
-                expired_users = GroupUser.query.options(
-                    joinedload(GroupUser.group)
-                ).filter(
-                    GroupUser.expiration_date.isnot(None),
-                    GroupUser.expiration_date < now,
-                    GroupUser.is_banned == False
-                ).limit(EXPIRED_USERS_BATCH_SIZE).all()
-                
-                if expired_users:
-                    print(f"🔍 Found {len(expired_users)} expired users to ban (batch limit: {EXPIRED_USERS_BATCH_SIZE})", flush=True)
-                
-                # Collect users to ban and prepare async operations
-                # Also retrieve configurations here to avoid repeated context creation
-                users_to_ban = []
-                for user in expired_users:
-                    if user.group and user.group.is_active:
-                        # Get configuration in sync context
-                        conf = get_group_conf(user.group)
-                        ban_msg = conf.get('msg_expired_ban', '⛔️ <b>您的认证已过期，已被暂时禁言。请联系管理员续费。</b>')
-                        users_to_ban.append((user, user.group, ban_msg))
-                
-                if not users_to_ban:
-                    return None
-                    
-                # Mark users as banned in database first
-                for user, group, _ in users_to_ban:
-                    user.is_banned = True
-                
-                # Commit all changes at once
-                db.session.commit()
-                print(f"✅ Marked {len(users_to_ban)} users as banned in database", flush=True)
-                
-                # Return the list for async processing
-                return users_to_ban
-                            
-            except Exception as e:
-                print(f"Error in check_expired_users sync part: {e}")
-                db.session.rollback()
-                return None
-    
-    # Run sync DB operations in executor
-    users_to_ban = await asyncio.get_running_loop().run_in_executor(None, _sync_check)
-    
-    if not users_to_ban:
-        return
-    
-    # Now perform all async Telegram operations with rate limiting
-    async def ban_user_async(user, group, ban_msg):
+    async def ban_user_async(tg_id, chat_id, title, ban_msg):
         """Ban a single user and send notification"""
         try:
             # Ban the user in the group
-            await context.bot.restrict_chat_member(
-                chat_id=group.chat_id,
-                user_id=user.tg_id,
+            await outbound.call(
+                PRIORITY_ADMIN, None, bot.restrict_chat_member, block_key=chat_id,
+                chat_id=chat_id,
+                user_id=tg_id,
                 permissions=ChatPermissions(can_send_messages=False)
             )
-            print(f"⛔️ Banned expired user {user.tg_id} in group {group.title}", flush=True)
+            print(f"⛔️ Banned expired user {tg_id} in group {title}", flush=True)
             
             # Try to send notification to user privately
             try:
                 # Sanitize HTML before sending to Telegram
                 sanitized_msg = sanitize_html_for_telegram(ban_msg)
-                await context.bot.send_message(
-                    chat_id=user.tg_id,
+                await outbound.call(
+                    PRIORITY_ADMIN, tg_id, bot.send_message,
+                    chat_id=tg_id,
                     text=sanitized_msg,
                     parse_mode='HTML'
                 )
             except Exception as e:
                 # If private message fails, we don't send to group to avoid spam
-                print(f"Failed to send ban notification to user {user.tg_id}: {e}")
+                print(f"Failed to send ban notification to user {tg_id}: {e}")
                 
         except Exception as e:
-            print(f"Error banning user {user.tg_id}: {e}")
-    
-    # Use semaphore to limit concurrent operations and avoid Telegram API rate limits
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_BANS)
+            print(f"Error banning user {tg_id}: {e}")
     
-    async def ban_with_limit(user, group, ban_msg):
-        async with semaphore:
-            await ban_user_async(user, group, ban_msg)
-    
-    # Run ban operations with rate limiting
-    await asyncio.gather(*[ban_with_limit(user, group, ban_msg) for user, group, ban_msg in users_to_ban], return_exceptions=True)
+    async with _expiry_drain_lock:
+        cursor = None
+        while True:
+            with span('ban_db'):
+                users_to_ban, cursor = await run_db(global_flask_app, _ban_expired_batch, cursor)
+            if users_to_ban:
+                # Rate limiting is handled by the outbound scheduler
+                with span('ban_send'):
+                    await asyncio.gather(*[ban_user_async(*u) for u in users_to_ban], return_exceptions=True)
+            if cursor is None:
+                break
+
+@tracked('expiry_sweep')
+async def check_expired_users(context):
+    """
+    Periodic safety net for the expiry scheduler: drain any expired users
+    """
+    await drain_expired_users(context.bot)
+
+def _active_group_ids():
+    return [gid for (gid,) in db.session.query(BotGroup.id).filter(BotGroup.is_active == True).all()]
+
+def _invalidate_query_pages(group_ids):
+    for gid in group_ids:
+        page_cache.invalidate(gid)
 
 async def run_bot(app_instance):
     """
@@ -545,7 +917,8 @@ async def run_bot(app_instance):
     global_flask_app = app_instance # 📦 存储 Flask App 实例
 
     print("🤖 正在初始化 Bot...", flush=True)
-    app = Application.builder().token(token).build()
+    # Bot API 调用走带计时的请求对象（连接池大小同 PTB 默认）
+    app = Application.builder().token(token).request(InstrumentedRequest(connection_pool_size=256)).build()
     
     global global_ptb_app
     global_ptb_app = app
@@ -558,15 +931,41 @@ async def run_bot(app_instance):
     # Add periodic job to check expired users
     app.job_queue.run_repeating(check_expired_users, interval=EXPIRATION_CHECK_INTERVAL, first=10)
     
+    # 配置了 BOT_ASYNC_DATABASE_URL 时，Bot 侧数据库工作改由异步引擎在 Loop 上执行
+    if init_async_engine():
+        print("✅ Bot 数据库使用异步引擎", flush=True)
     await app.initialize()
     await app.start()
+    update_ingress.start(app)
+    outbound.start()
+    deletion_service.start(app.bot)
+    checkin_buffer.start(app_instance, run_db)
+    # 打卡落库后，相关群的查询页缓存失效
+    checkin_buffer.add_listener(_invalidate_query_pages)
+    # 快照被淘汰时，引用它的缓存页一并丢弃，避免翻页按钮指向已失效的快照
+    snapshot_store.add_listener(page_cache.discard_snapshots)
+    try:
+        n = await run_db(app_instance, today_roster.warm)
+        print(f"✅ 今日打卡名单已加载 ({n} 人)", flush=True)
+    except Exception as e:
+        print(f"⚠️ 今日打卡名单加载失败，查询走数据库: {e}", flush=True)
+    group_stats.start(app_instance, run_db, _active_group_ids)
+    expiry_scheduler.start(app_instance, run_db, lambda: drain_expired_users(app.bot))
+    reaction_queue.start(app.bot)
     
     # 根据环境变量自动判断运行模式
     domain = os.getenv('RAILWAY_PUBLIC_DOMAIN', '').strip()
     if domain:
         # Webhook 模式：注册 Webhook 地址到 Telegram
-        webhook_url = f"https://{domain}/core/webhook"
+        webhook_url = os.getenv('WEBHOOK_URL', '').strip() or f"https://{domain}/core/webhook"
+        # 设置 WEBHOOK_LISTEN_PORT 时由 Bot Loop 上的原生监听直接收 Update，Flask 只负责后台页面
+        listen_port = safe_int(os.getenv('WEBHOOK_LISTEN_PORT'), 0)
         try:
+            if listen_port:
+                global global_webhook_server
+                global_webhook_server = WebhookServer(app, update_ingress, port=listen_port)
+                await global_webhook_server.start()
+                print(f"✅ 原生 Webhook 监听已启动，端口: {listen_port}", flush=True)
             await app.bot.set_webhook(url=webhook_url)
             print(f"✅ Bot 初始化完成 (Webhook 模式)，Webhook URL: {webhook_url}", flush=True)
         except Exception as e:
@@ -582,15 +981,22 @@ async def run_bot(app_instance):
             print(f"❌ Polling 启动失败: {e}", flush=True)
             raise
 
-def do_like(chat_id, message_id, emoji):
-    token = os.getenv('TG_BOT_TOKEN')
-    if not token or not emoji: return
-    clean_emoji = emoji.strip()
-    try: 
-        url = f"https://api.telegram.org/bot{token}/setMessageReaction"
-        requests.post(url, json={"chat_id": chat_id, "message_id": message_id, "reaction": [{"type": "emoji", "emoji": clean_emoji}]}, timeout=5)
-    except Exception as e: print(f"❌ [Like] 请求异常: {e}", flush=True)
+def _send(priority, chat_key, func, *args, delete_after=0, **kwargs):
+    """
+    Queue a bot reply without waiting for it. Handlers must not await the
+    outbound scheduler: a group's 20/min bucket would hold the ingress worker
+    (or the polling updater) until the reply leaves. The auto-delete, if any,
+    is scheduled once the message has been sent.
+    """
+    future = outbound.post(priority, chat_key, func, *args, **kwargs)
+    if delete_after > 0:
+        def _sent(f):
+            if not f.cancelled() and f.exception() is None:
+                deletion_service.schedule(f.result(), delete_after)
+        future.add_done_callback(_sent)
+    return future
 
+@tracked('start')
 async def cmd_start(update: Update, context):
     print(f"✅ /start 命令被触发，用户 ID: {update.effective_user.id}")
     user_id = update.effective_user.id
@@ -599,29 +1005,28 @@ async def cmd_start(update: Update, context):
     if user_id == admin_id:
         # Create authentication session for admin
         def _create_auth_session():
-            with global_flask_app.app_context():
-                # Clean up old sessions for this user
-                AuthSession.query.filter_by(user_id=user_id).delete()
+            # Clean up old sessions for this user
+            AuthSession.query.filter_by(user_id=user_id).delete()
                 
-                # Create new auth session
-                session_token = generate_session_token()
-                verification_code = generate_verification_code()
-                expires_at = get_beijing_now() + timedelta(minutes=AUTH_SESSION_EXPIRY_MINUTES)
+            # Create new auth session
+            session_token = generate_session_token()
+            verification_code = generate_verification_code()
+            expires_at = get_beijing_now() + timedelta(minutes=AUTH_SESSION_EXPIRY_MINUTES)
                 
-                auth_session = AuthSession(
-                    user_id=user_id,
-                    session_token=session_token,
-                    verification_code=verification_code,
-                    is_verified=False,
-                    expires_at=expires_at
-                )
-                db.session.add(auth_session)
-                db.session.commit()
+            auth_session = AuthSession(
+                user_id=user_id,
+                session_token=session_token,
+                verification_code=verification_code,
+                is_verified=False,
+                expires_at=expires_at
+            )
+            db.session.add(auth_session)
+            db.session.commit()
                 
-                return session_token
+            return session_token
         
         # Create session in executor to avoid blocking
-        session_token = await asyncio.get_running_loop().run_in_executor(None, _create_auth_session)
+        session_token = await run_db(global_flask_app, _create_auth_session)
         
         domain = os.getenv('RAILWAY_PUBLIC_DOMAIN', '').rstrip('/')
         if domain:
@@ -633,16 +1038,18 @@ async def cmd_start(update: Update, context):
         keyboard = [[InlineKeyboardButton("🔐 点击验证身份", url=verify_url)]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_html(
+        _send(
+            PRIORITY_CHECKIN, user_id, update.message.reply_html,
             "👋 <b>欢迎，管理员！</b>\n\n"
             "请点击下方按钮进入身份验证页面，\n"
             "将页面上的验证码发送给我以完成登录。",
             reply_markup=reply_markup
         )
     else:
-        await update.message.reply_html(f"👋 你好！我是打卡机器人。\n你的 ID 是：<code>{user_id}</code>")
+        _send(PRIORITY_CHECKIN, user_id, update.message.reply_html, f"👋 你好！我是打卡机器人。\n你的 ID 是：<code>{user_id}</code>")
 
 
+@tracked('my_chat_member')
 async def on_my_chat_member(update: Update, context):
     try:
         chat = update.effective_chat
@@ -650,8 +1057,7 @@ async def on_my_chat_member(update: Update, context):
         user = update.effective_user
         
         if chat.type in ['group', 'supergroup'] and status in ['administrator', 'member']:
-            # 使用全局 App Context
-            with global_flask_app.app_context():
+            def _register_group():
                 g = BotGroup.query.filter_by(chat_id=str(chat.id)).first()
                 if not g:
                     g = BotGroup(chat_id=str(chat.id), title=chat.title, type=chat.type, is_active=True)
@@ -659,6 +1065,9 @@ async def on_my_chat_member(update: Update, context):
                     db.session.add(g)
                     db.session.commit()
                     print(f"➕ 新群组注册: {chat.title}")
+                group_registry.invalidate(chat.id)
+            
+            await run_db(global_flask_app, _register_group)
                 
             domain = os.getenv('RAILWAY_PUBLIC_DOMAIN', '')
             if domain:
@@ -667,15 +1076,42 @@ async def on_my_chat_member(update: Update, context):
                 if is_admin:
                     token = jwt.encode({'uid': user.id, 'chat_id': chat.id, 'exp': time.time() + 86400 * JWT_TOKEN_EXPIRY_DAYS}, os.getenv('SECRET_KEY', 'default_secret_key'), algorithm='HS256')
                     url = f"https://{domain}/core/magic_login?token={token}"
-                    try: 
-                        await context.bot.send_message(chat.id, f"✅ 机器人已激活！\n\n👉 [点击进入后台管理]({url})\n\n⚠️ 注意：仅群组管理员可访问后台", parse_mode='Markdown')
-                    except: pass
+                    _send(PRIORITY_ADMIN, chat.id, context.bot.send_message, chat.id, f"✅ 机器人已激活！\n\n👉 [点击进入后台管理]({url})\n\n⚠️ 注意：仅群组管理员可访问后台", parse_mode='Markdown')
                 else:
-                    try: 
-                        await context.bot.send_message(chat.id, f"✅ 机器人已激活！")
-                    except: pass
+                    _send(PRIORITY_ADMIN, chat.id, context.bot.send_message, chat.id, f"✅ 机器人已激活！")
     except Exception as e: print(f"Error in on_my_chat_member: {e}")
 
+def _checkin_unit(group_id, tg_id):
+    """
+    DB side of a check-in. Returns (status, newly_banned) where status is
+    'not_registered', 'expired', 'repeat' or 'ok'.
+    """
+    db_user = GroupUser.query.filter_by(group_id=group_id, tg_id=tg_id).first()
+    if not db_user:
+        return 'not_registered', False
+    # Check if user is expired and should be banned
+    if db_user.expiration_date and get_beijing_now() > db_user.expiration_date:
+        if db_user.is_banned:
+            return 'expired', False
+        db_user.is_banned = True
+        db.session.commit()
+        group_stats.adjust(group_id, banned=1)
+        return 'expired', True
+    # Check if user has already checked in today (DB, then unwritten check-ins)
+    today = get_beijing_today()
+    if db_user.checkin_time and db_user.checkin_time >= today:
+        return 'repeat', False
+    # 写后缓冲：内存中确认打卡，批量 UPDATE 由后台定时落库
+    now = get_beijing_now()
+    if not checkin_buffer.claim(db_user.id, group_id, now, today):
+        return 'repeat', False
+    try: profile = json.loads(db_user.profile_data or '{}')
+    except ValueError: profile = {}
+    today_roster.checked_in(group_id, db_user.id, db_user.tg_id, profile, now)
+    page_cache.invalidate(group_id)
+    return 'ok', False
+
+@tracked('message')
 async def on_message(update: Update, context):
     if not global_flask_app: return
     try:
@@ -692,238 +1128,278 @@ async def on_message(update: Update, context):
             if user.id == admin_id and txt.isdigit() and len(txt) == 6:
                 # Try to verify the code using constant-time comparison
                 def _verify_code():
-                    with global_flask_app.app_context():
-                        # Get all pending sessions for this user
-                        pending_sessions = AuthSession.query.filter_by(
-                            user_id=user.id,
-                            is_verified=False
-                        ).all()
-                        
-                        # Use constant-time comparison to prevent timing attacks
-                        for auth_session in pending_sessions:
-                            if hmac.compare_digest(auth_session.verification_code, txt):
-                                # Check if not expired
-                                if get_beijing_now() <= auth_session.expires_at:
-                                    auth_session.is_verified = True
-                                    db.session.commit()
-                                    return True
-                                else:
-                                    return False
-                        return None
+                    # Get all pending sessions for this user
+                    pending_sessions = AuthSession.query.filter_by(
+                        user_id=user.id,
+                        is_verified=False
+                    ).all()
+                    
+                    # Use constant-time comparison to prevent timing attacks
+                    for auth_session in pending_sessions:
+                        if hmac.compare_digest(auth_session.verification_code, txt):
+                            # Check if not expired
+                            if get_beijing_now() <= auth_session.expires_at:
+                                auth_session.is_verified = True
+                                db.session.commit()
+                                return True
+                            else:
+                                return False
+                    return None
                 
-                result = await asyncio.get_running_loop().run_in_executor(None, _verify_code)
+                result = await run_db(global_flask_app, _verify_code)
                 
                 if result is True:
-                    await msg.reply_html("✅ <b>验证成功！</b>\n\n网页将自动跳转到管理后台。")
+                    _send(PRIORITY_CHECKIN, chat.id, msg.reply_html, "✅ <b>验证成功！</b>\n\n网页将自动跳转到管理后台。")
                     return
                 elif result is False:
-                    await msg.reply_html("⚠️ <b>验证码已过期</b>\n\n请重新发送 /start 获取新的验证码。")
+                    _send(PRIORITY_CHECKIN, chat.id, msg.reply_html, "⚠️ <b>验证码已过期</b>\n\n请重新发送 /start 获取新的验证码。")
                     return
-                # If result is None, fall through to normal message processing
+            # 私聊不会是已注册的群，验证码之外的消息不必查群组
+            return
 
-        # 使用全局 App Context
-        with global_flask_app.app_context():
-            # 1. 自动点赞
-            group = BotGroup.query.filter_by(chat_id=str(chat.id)).first()
-            if not group or not group.is_active:
-                return
-            
-            conf = get_group_conf(group)
-            if conf.get('auto_like'):
-                db_user = GroupUser.query.filter_by(group_id=group.id, tg_id=user.id).first()
-                if db_user:
-                    emoji = conf.get('like_emoji', '❤️')
-                    # 在线程中执行阻塞请求，避免卡顿
-                    asyncio.get_running_loop().run_in_executor(None, do_like, chat.id, msg.message_id, emoji)
-            
-            # 2. 打卡
-            checkin_cmds = [c.strip() for c in conf.get('checkin_cmd', '打卡').split(',')]
-            if conf.get('checkin_open') and txt in checkin_cmds:
-                db_user = GroupUser.query.filter_by(group_id=group.id, tg_id=user.id).first()
-                if not db_user:
-                    msg_text = sanitize_html_for_telegram(conf.get('msg_not_registered', '未认证'))
-                    await msg.reply_html(msg_text)
+        # 群组走内存缓存，未命中才到 DB 线程池加载
+        hit, group = group_registry.cached(chat.id)
+        if not hit:
+            with span('group_load'):
+                group = await run_db(global_flask_app, group_registry.load, chat.id)
+        if not group or not group.is_active:
+            return
+        
+        conf = group.conf
+        checkin_cmds = [c.strip() for c in conf.get('checkin_cmd', '打卡').split(',')]
+        is_checkin = conf.get('checkin_open') and txt in checkin_cmds
+        
+        # 本条消息的数据库工作作为一个单元在 DB 线程池里完成，Loop 只 await
+        status, newly_banned, registered = None, False, False
+        if is_checkin:
+            set_handler('checkin')
+            with span('checkin_db'):
+                status, newly_banned = await run_db(global_flask_app, _checkin_unit, group.id, user.id)
+            registered = status != 'not_registered'
+        elif conf.get('auto_like'):
+            # 已知成员直接从内存判断，闲聊不必每条都到 DB 线程池查一次
+            registered = member_cache.is_member(group.id, user.id)
+            if registered is None:
+                with span('member_db'):
+                    registered = await run_db(global_flask_app, member_cache.lookup, group.id, user.id)
+        
+        # 1. 自动点赞
+        if conf.get('auto_like') and registered:
+            # 入队由后台 worker 通过 Bot 自带的异步客户端发送，满了直接丢弃
+            reaction_queue.offer(chat.id, msg.message_id, conf.get('like_emoji', '❤️'))
+        
+        # 2. 打卡
+        if is_checkin:
+            if status == 'not_registered':
+                msg_text = sanitize_html_for_telegram(conf.get('msg_not_registered', '未认证'))
+                _send(PRIORITY_CHECKIN, chat.id, msg.reply_html, msg_text)
+            elif status == 'expired':
+                if newly_banned:
+                    _send(
+                        PRIORITY_ADMIN, None, context.bot.restrict_chat_member, block_key=chat.id,
+                        chat_id=chat.id,
+                        user_id=user.id,
+                        permissions=ChatPermissions(can_send_messages=False)
+                    )
+                msg_text = sanitize_html_for_telegram(conf.get('msg_expired_ban', '⛔️ 您的认证已过期'))
+                _send(PRIORITY_CHECKIN, chat.id, msg.reply_html, msg_text)
+            else:
+                if status == 'repeat':
+                    # User already checked in today, send repeat check-in message
+                    msg_text = sanitize_html_for_telegram(conf.get('msg_repeat_checkin', '🔄 <b>今天已打卡</b>'))
                 else:
-                    # Check if user is expired and should be banned
-                    if db_user.expiration_date and get_beijing_now() > db_user.expiration_date:
-                        if not db_user.is_banned:
-                            db_user.is_banned = True
-                            db.session.commit()
-                            try:
-                                await context.bot.restrict_chat_member(
-                                    chat_id=chat.id,
-                                    user_id=user.id,
-                                    permissions=ChatPermissions(can_send_messages=False)
-                                )
-                            except Exception as e:
-                                print(f"Failed to ban user {user.id}: {e}")
-                        msg_text = sanitize_html_for_telegram(conf.get('msg_expired_ban', '⛔️ 您的认证已过期'))
-                        await msg.reply_html(msg_text)
-                    else:
-                        # Check if user has already checked in today
-                        today = get_beijing_today()
-                        if db_user.checkin_time and db_user.checkin_time >= today:
-                            # User already checked in today, send repeat check-in message
-                            msg_text = sanitize_html_for_telegram(conf.get('msg_repeat_checkin', '🔄 <b>今天已打卡</b>'))
-                            r = await msg.reply_html(msg_text)
-                            del_time = safe_int(conf.get('checkin_del_time'), 0)
-                            if del_time > 0:
-                                context.job_queue.run_once(lambda c: c.job.data.delete(), del_time, data=r)
-                        else:
-                            # First check-in today, proceed normally
-                            db_user.checkin_time = get_beijing_now()
-                            db_user.online = True
-                            db.session.commit()
-                            msg_text = sanitize_html_for_telegram(conf.get('msg_checkin_success', '打卡成功'))
-                            r = await msg.reply_html(msg_text)
-                            del_time = safe_int(conf.get('checkin_del_time'), 0)
-                            if del_time > 0:
-                                context.job_queue.run_once(lambda c: c.job.data.delete(), del_time, data=r)
-                return
+                    msg_text = sanitize_html_for_telegram(conf.get('msg_checkin_success', '打卡成功'))
+                _send(PRIORITY_CHECKIN, chat.id, msg.reply_html, msg_text, delete_after=safe_int(conf.get('checkin_del_time'), 0))
+            return
 
-            # 3. 查询
-            query_cmds = [c.strip() for c in conf.get('query_cmd', '查询').split(',')]
-            is_search = False
-            kw = None
-            
-            if conf.get('query_open') and txt in query_cmds:
-                is_search = True
-            elif conf.get('query_filter_open'):
-                for cmd in query_cmds:
-                    if txt.startswith(cmd + " "):
-                        kw = txt[len(cmd):].strip()
-                        is_search = True
-                        break
-                if not is_search and 0 < len(txt) < 15 and not txt.startswith('/'):
-                    kw = txt
+        # 3. 查询
+        query_cmds = [c.strip() for c in conf.get('query_cmd', '查询').split(',')]
+        is_search = False
+        kw = None
+        
+        if conf.get('query_open') and txt in query_cmds:
+            is_search = True
+        elif conf.get('query_filter_open'):
+            for cmd in query_cmds:
+                if txt.startswith(cmd + " "):
+                    kw = txt[len(cmd):].strip()
                     is_search = True
+                    break
+            if not is_search and 0 < len(txt) < 15 and not txt.startswith('/'):
+                kw = txt
+                is_search = True
+        
+        if is_search and kw:
+            # 关键词的 n-gram 不全在今日打卡资料里时不可能命中，闲聊直接放过，不查库
+            if today_roster.might_match(group.id, kw) is False:
+                return
+        
+        if is_search:
+            set_handler('query')
+            text_resp, markup, total = await do_query_page(chat.id, group, kw, 1)
             
-            if is_search:
-                fields = get_group_fields(group)
-                # 关键：在这里调用查询，上下文已在上方 with 块中建立
-                text_resp, markup, users = await do_query_page(chat.id, group.id, conf, fields, kw, 1)
-                
-                if users or (not kw and not users):
-                    if not text_resp: text_resp = "😢 暂无数据"
-                    sent = await msg.reply_html(text_resp, reply_markup=markup, disable_web_page_preview=True)
-                    del_time = safe_int(conf.get('query_del_time'), 60)
-                    if del_time > 0:
-                        context.job_queue.run_once(lambda c: c.job.data.delete(), del_time, data=sent)
+            if total or not kw:
+                if not text_resp: text_resp = "😢 暂无数据"
+                _send(PRIORITY_QUERY, chat.id, msg.reply_html, text_resp, reply_markup=markup, disable_web_page_preview=True,
+                      delete_after=safe_int(conf.get('query_del_time'), 60))
 
     except Exception as e:
         print(f"Msg Error: {e}")
 
 # --- 分页逻辑 ---
-async def do_query_page(chat_id, group_id, conf, fields, kw=None, page=1):
-    # ⚡️ 修复：移除 create_app()，假定外部已建立 Context，或者在这里使用全局 app
-    # 为了兼容 pagination_callback 和 on_message，这里做个判断
-    # 如果已经在 Context 中（如 on_message 调用），此代码块复用 Context 还是会正常工作？
-    # Flask SQLAlchemy 的 Context 是 Thread Local 的。
-    # 因为我们在 async 函数中，建议显式使用 global_flask_app
-    
-    if not global_flask_app: return None, None, None
-
-    # 使用 run_in_executor 避免阻塞 Async Loop
-    def _sync_query():
-        nonlocal page
-        with global_flask_app.app_context():
-            today = get_beijing_today()
-            # Always filter by today's check-in, whether it's a keyword search or not
-            # Requirement: "所有的查询只显示已经今日打卡的认证用户" (ALL queries should only show users who checked in today)
-            base = GroupUser.query.filter(
-                GroupUser.group_id == group_id,
-                GroupUser.online == True,
-                GroupUser.checkin_time >= today
-            )
-            
-            if kw:
-                base = base.filter(GroupUser.profile_data.contains(kw))
-                header = conf.get('msg_filter_header', '🔍 <b>筛选结果：</b>')
-            else:
-                header = conf.get('msg_query_header', '🔍 <b>今日在线：</b>')
-                
-            users = base.order_by(GroupUser.id.desc()).all()
-            if not users: return None, None, None
-            
-            page_size = safe_int(conf.get('page_size'), 10)
-            total_pages = math.ceil(len(users) / page_size) or 1
-            if page > total_pages: page = total_pages
-            if page < 1: page = 1
-            
-            start = (page - 1) * page_size
-            current_users = users[start:start+page_size]
-            
-            tpl = conf.get('template', '{tg_id}')
-            f_map = {f['key']: f['label'] for f in fields}
-            lines = []
-            for idx, u in enumerate(current_users):
-                try:
-                    d = json.loads(u.profile_data or '{}')
-                    l = tpl.replace("{onlineEmoji}", conf.get('online_emoji',''))
-                    for k, lbl in f_map.items(): l = l.replace(f"{{{lbl}}}", str(d.get(k,'')))
-                    l = l.replace("{序号}", str(start + idx + 1))
-                    l = l.replace("{tg_id}", str(u.tg_id))
-                    lines.append(re.sub(r'\{.*?\}', '', l))
-                except: continue
-                
-            text = header + "\n\n" + "\n".join(lines)
-            
-            # Sanitize HTML before sending to Telegram
-            text = sanitize_html_for_telegram(text)
-            
-            buttons = []
-            nav_row = []
-            safe_kw = kw if kw else "None"
-            if page > 1: nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"pg|{page-1}|{safe_kw}"))
-            nav_row.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
-            if page < total_pages: nav_row.append(InlineKeyboardButton("➡️", callback_data=f"pg|{page+1}|{safe_kw}"))
-            if nav_row: buttons.append(nav_row)
+def _build_query_page(conf, fields, kw, page, total, fetch, sid):
+    """Render one query page; fetch(start, limit) returns [(tg_id, profile), ...]."""
+    if not total: return None, None, 0
+    if kw:
+        header = conf.get('msg_filter_header', '🔍 <b>筛选结果：</b>')
+    else:
+        header = conf.get('msg_query_header', '🔍 <b>今日在线：</b>')
+        
+    page_size = max(safe_int(conf.get('page_size'), 10), 1)
+    total_pages = math.ceil(total / page_size) or 1
+    if page > total_pages: page = total_pages
+    if page < 1: page = 1
+        
+    start = (page - 1) * page_size
+    plan = compile_template(conf.get('template', '{tg_id}'), template_fields(fields))
+    emoji = conf.get('online_emoji', '')
+    lines = []
+    with span('fetch'):
+        rows = fetch(start, page_size)
+    with span('render'):
+        for idx, (tg_id, d) in enumerate(rows):
+            try: lines.append(render_plan(plan, d, tg_id=tg_id, seq=start + idx + 1, emoji=emoji))
+            except: continue
             
-            custom_btns = conf.get('custom_buttons', '')
-            if custom_btns:
-                try:
-                    btn_list = json.loads(custom_btns)
+    text = header + "\n\n" + "\n".join(lines)
+        
+    # Sanitize HTML before sending to Telegram
+    with span('sanitize'):
+        text = sanitize_html_for_telegram(text)
+        
+    buttons = []
+    nav_row = []
+    # 翻页按钮只带结果快照 id 与页码
+    if page > 1: nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"ps|{sid}|{page-1}"))
+    nav_row.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
+    if page < total_pages: nav_row.append(InlineKeyboardButton("➡️", callback_data=f"ps|{sid}|{page+1}"))
+    if nav_row: buttons.append(nav_row)
+        
+    custom_btns = conf.get('custom_buttons', '')
+    if custom_btns:
+        try:
+            btn_list = json.loads(custom_btns)
+            row = []
+            for btn in btn_list:
+                row.append(InlineKeyboardButton(btn['text'], url=btn['url']))
+                if len(row) == 2:
+                    buttons.append(row)
                     row = []
-                    for btn in btn_list:
-                        row.append(InlineKeyboardButton(btn['text'], url=btn['url']))
-                        if len(row) == 2:
-                            buttons.append(row)
-                            row = []
-                    if row: buttons.append(row)
-                except: pass
-                
-            return text, InlineKeyboardMarkup(buttons), users
+            if row: buttons.append(row)
+        except: pass
+            
+    return text, InlineKeyboardMarkup(buttons), total
+
+def _checked_in_today_query(group_id, today):
+    """Users of a group checked in since `today`; served by ix_group_users_online_checkin."""
+    return GroupUser.query.filter(
+        GroupUser.group_id == group_id,
+        GroupUser.online == True,
+        GroupUser.checkin_time >= today
+    )
+
+async def do_query_page(chat_id, group, kw=None, page=1):
+    # Flask SQLAlchemy 的 Context 是 Thread Local 的，由 run_db 在 DB 线程里建立
+    if not global_flask_app: return None, None, None
+    group_id = group.id
 
-    # 在 Executor 中运行同步 DB 操作
-    return await asyncio.get_running_loop().run_in_executor(None, _sync_query)
+    # 渲染结果按 (群, 关键词, 页, 配置版本, 日期) 缓存，打卡/改资料时按群失效
+    cache_key = page_cache.key(group_id, kw, page, group.version)
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
+    # 同一结果集（群、关键词、日期、名单生成号）共用一个快照，缓存未命中不再各建一份
+    result_key = page_cache.result_key(group_id, kw)
+    sid, snap = snapshot_store.find(result_key)
+    if snap is None:
+        snap = QuerySnapshot(group_id, kw, get_beijing_today(), get_beijing_now())
+        sid = snapshot_store.create(snap, result_key)
+    result = await do_snapshot_page(group, snap, sid, page)
+    page_cache.put(cache_key, result, sid)
+    return result
+
+def _snapshot_query(snap):
+    """Users in a snapshot: checked in on its day, by its as_of time, matching its keyword."""
+    # Always filter by today's check-in, whether it's a keyword search or not
+    # Requirement: "所有的查询只显示已经今日打卡的认证用户" (ALL queries should only show users who checked in today)
+    base = _checked_in_today_query(snap.group_id, snap.day).filter(GroupUser.checkin_time <= snap.as_of)
+    if snap.kw:
+        base = base.filter(*keyword_filter(snap.group_id, snap.kw))
+    return base
+
+def _sql_snapshot_page(conf, fields, snap, page, sid):
+    """Render a snapshot page with a COUNT and a LIMIT/OFFSET query. Needs an app context."""
+    base = _snapshot_query(snap)
+    with span('sql_count'):
+        total = base.with_entities(func.count(GroupUser.id)).scalar()
+
+    def _fetch(start, limit):
+        rows = base.with_entities(GroupUser.tg_id, GroupUser.profile_data).order_by(
+            GroupUser.id.desc()).offset(start).limit(limit).all()
+        result = []
+        for tg_id, raw in rows:
+            try: result.append((tg_id, json.loads(raw or '{}')))
+            except ValueError: continue
+        return result
+
+    return _build_query_page(conf, fields, snap.kw, page, total, _fetch, sid)
+
+async def do_snapshot_page(group, snap, sid, page):
+    """Render a page of a snapshot; only the page's users are resolved."""
+    # 今日名单已在内存：筛选、分页、渲染都不查库
+    if snap.day == get_beijing_today():
+        with span('roster'):
+            entries = today_roster.select(snap.group_id, snap.kw)
+        if entries is not None:
+            entries = [e for e in entries if e.checkin_time <= snap.as_of]
+            return _build_query_page(group.conf, group.fields, snap.kw, page, len(entries),
+                                     lambda start, limit: [(e.tg_id, e.profile) for e in entries[start:start + limit]], sid)
+    # 名单未就绪或已跨天，到 DB 线程池只取当前页
+    return await run_db(global_flask_app, _sql_snapshot_page, group.conf, group.fields, snap, page, sid)
+
+@tracked('pagination')
 async def pagination_callback(update: Update, context):
     query = update.callback_query
-    if query.data == "noop": return await query.answer()
+    chat = update.effective_chat
+    # 回调应答不占群的发消息额度，但该群被 429 暂停时一起等待
+    block_key = chat.id if chat else None
+    if query.data == "noop": return _send(PRIORITY_QUERY, None, query.answer, block_key=block_key)
     try:
         parts = query.data.split('|')
-        page = int(parts[1])
-        kw = parts[2] if parts[2] != "None" else None
-        
-        chat = update.effective_chat
         
         # ⚡️ 修复：使用全局 Flask App
-        if not global_flask_app: return await query.answer("System Starting...")
+        if not global_flask_app: return _send(PRIORITY_QUERY, None, query.answer, "System Starting...", block_key=block_key)
 
-        # 上面 lambda 写法太绕，直接用同步函数包装即可：
-        def _get_group_info():
-            with global_flask_app.app_context():
-                g = BotGroup.query.filter_by(chat_id=str(chat.id)).first()
-                if not g: return None, None, None
-                return g.id, get_group_conf(g), get_group_fields(g)
-        
-        res = await asyncio.get_running_loop().run_in_executor(None, _get_group_info)
-        if not res or not res[0]: return await query.answer("Expired")
-        gid, conf, fields = res
+        # 优先命中群组缓存，未命中才去线程池查库
+        hit, g = group_registry.cached(chat.id)
+        if not hit:
+            with span('group_load'):
+                g = await run_db(global_flask_app, group_registry.load, chat.id)
+        if not g: return _send(PRIORITY_QUERY, None, query.answer, "Expired", block_key=block_key)
 
-        text, markup, _ = await do_query_page(chat.id, gid, conf, fields, kw, page)
+        if parts[0] == 'ps':
+            # 翻页读取首次查询记录的结果快照，不重新查询
+            snap = snapshot_store.get(parts[1])
+            if not snap or snap.group_id != g.id:
+                return _send(PRIORITY_QUERY, None, query.answer, "结果已过期，请重新查询", block_key=block_key)
+            text, markup, _ = await do_snapshot_page(g, snap, parts[1], int(parts[2]))
+        else:
+            # 旧版按钮 pg|page|kw：重新查询
+            kw = parts[2] if parts[2] != "None" else None
+            text, markup, _ = await do_query_page(chat.id, g, kw, int(parts[1]))
         if text:
-            await query.edit_message_text(text=text, parse_mode='HTML', reply_markup=markup, disable_web_page_preview=True)
+            _send(PRIORITY_QUERY, chat.id, query.edit_message_text, text=text, parse_mode='HTML', reply_markup=markup, disable_web_page_preview=True)
     except Exception as e: 
         print(f"Page Error: {e}")
-    await query.answer()
+    _send(PRIORITY_QUERY, None, query.answer, block_key=block_key)
@@ -0,0 +1,214 @@
+from telegram.error import RetryAfter
+import asyncio
+import functools
+import itertools
+import time
+
+# 优先级：数值越小越先发送
+PRIORITY_CHECKIN = 0   # 打卡回复、私聊交互
+PRIORITY_QUERY = 1     # 查询结果与翻页
+PRIORITY_ADMIN = 2     # 禁言/解禁、推送、入群通知
+PRIORITY_DELETE = 3    # 自动删除
+PRIORITY_REACTION = 4  # 自动点赞
+
+# Telegram limits: ~30 requests/s per bot, 20 messages/min per group, ~1 message/s per private chat
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+GROUP_CHAT_RATE = 20 / 60.0
+GROUP_CHAT_BURST = 20
+PRIVATE_CHAT_RATE = 1.0
+PRIVATE_CHAT_BURST = 3
+MAX_IN_FLIGHT = 8  # Concurrent outbound API calls
+MAX_RETRIES = 3  # Re-queues after a 429 before giving up
+CHAT_BUCKET_IDLE_SECONDS = 600  # Drop per-chat buckets unused for this long
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception():
+        print(f"❌ [Outbound] 发送失败: {future.exception()}", flush=True)
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+        # 暂停期间不累积令牌：解除后从空桶按速率恢复，不会 429 后立刻整桶突发
+        self.tokens = 0.0
+        self.updated = max(self.updated, self.blocked_until)
+
+class _Job:
+    __slots__ = ('chat_key', 'block_key', 'func', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, chat_key, func, args, kwargs, future, block_key=None):
+        self.chat_key = chat_key
+        self.block_key = chat_key if chat_key is not None else block_key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+class OutboundScheduler:
+    """
+    Single gate for Telegram API calls made by the bot.
+
+    Calls are served by priority (check-in replies first, reactions last)
+    under a global token bucket, plus a per-chat bucket when a chat key is
+    given (message sends). Calls that do not count against a chat's message
+    limit (reactions, deletions, restrictions) pass the chat as block_key
+    instead. A RetryAfter pauses that chat, or the whole bot for calls with
+    neither key, and the call is re-queued.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._slots = None
+        self._seq = itertools.count()
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats = {}
+        self._loop = None
+        self._tasks = set()  # 持有运行中任务的引用，防止被 GC 回收
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+
+    def start(self):
+        """Start the dispatcher; must be called on the bot loop."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self._spawn(self._dispatch())
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def call(self, priority, chat_key, func, *args, block_key=None, **kwargs):
+        """Schedule func(*args, **kwargs) and wait for its result."""
+        return await self.submit(priority, chat_key, func, *args, block_key=block_key, **kwargs)
+
+    def submit(self, priority, chat_key, func, *args, block_key=None, **kwargs):
+        """Schedule a call without waiting; returns its future. Bot loop only."""
+        future = self._loop.create_future()
+        self._put(priority, _Job(chat_key, func, args, kwargs, future, block_key))
+        return future
+
+    def post(self, priority, chat_key, func, *args, block_key=None, **kwargs):
+        """Fire-and-forget variant of submit(); failures are only logged."""
+        future = self.submit(priority, chat_key, func, *args, block_key=block_key, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def post_threadsafe(self, priority, chat_key, func, *args, block_key=None, **kwargs):
+        """post() from a non-loop thread (Flask routes)."""
+        self._loop.call_soon_threadsafe(functools.partial(self.post, priority, chat_key, func, *args, block_key=block_key, **kwargs))
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"❌ [Outbound] 任务异常退出: {task.exception()!r}", flush=True)
+
+    def _put(self, priority, job):
+        self._queue.put_nowait((priority, next(self._seq), job))
+
+    def _chat_bucket(self, chat_key):
+        chat_key = str(chat_key)  # chat_id 可能是 int 或 DB 里的字符串，同一个群共用一个桶
+        bucket = self._chats.get(chat_key)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._evict_idle()
+            if chat_key.startswith('-'):
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chats[chat_key] = bucket
+        return bucket
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - CHAT_BUCKET_IDLE_SECONDS
+        for key in [k for k, b in self._chats.items() if b.updated < cutoff and b.blocked_until < cutoff]:
+            del self._chats[key]
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            priority, seq, job = await self._queue.get()
+            if job.future.done():
+                self._slots.release()
+                continue
+            now = time.monotonic()
+            if job.block_key is not None:
+                bucket = self._chat_bucket(job.block_key)
+                # 只有 chat_key 消耗该群的发消息令牌；block_key 只受 429 暂停约束
+                wait = bucket.delay(now) if job.chat_key is not None else bucket.blocked_until - now
+                if wait > 0:
+                    # 该群限流：稍后按原序号放回，不阻塞其他群
+                    self._loop.call_later(wait, self._queue.put_nowait, (priority, seq, job))
+                    self._slots.release()
+                    continue
+            wait = self._global.delay(now)
+            if wait > 0:
+                self._queue.put_nowait((priority, seq, job))
+                self._slots.release()
+                await asyncio.sleep(wait)
+                continue
+            self._global.take()
+            if job.chat_key is not None:
+                self._chat_bucket(job.chat_key).take()
+            self._spawn(self._run(priority, job))
+
+    async def _run(self, priority, job):
+        self.in_flight += 1
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        except RetryAfter as e:
+            self.rate_limited += 1
+            until = time.monotonic() + float(e.retry_after)
+            if job.block_key is not None:
+                self._chat_bucket(job.block_key).block(until)
+            else:
+                self._global.block(until)
+            job.attempts += 1
+            if job.attempts <= MAX_RETRIES:
+                self.retried += 1
+                self._put(priority, job)
+            else:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+outbound = OutboundScheduler()
@@ -0,0 +1,87 @@
+from .services import get_beijing_today
+from collections import OrderedDict
+import threading
+import time
+
+PAGE_CACHE_SIZE = 512  # Rendered pages kept across all groups
+PAGE_CACHE_TTL = 600  # Seconds a rendered page may be served
+
+class QueryPageCache:
+    """
+    LRU cache of rendered query pages: (text, InlineKeyboardMarkup, total).
+
+    Keys carry the group's config version (from the group registry) and the
+    Beijing day, so settings changes and the midnight rollover miss
+    naturally. Roster changes call invalidate(group_id), which bumps the
+    group's generation and drops its entries. A page whose buttons point at
+    a result snapshot is dropped with that snapshot (discard_snapshots).
+    """
+
+    def __init__(self, maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._by_snapshot = {}  # snapshot id -> keys of the pages that link to it
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, group_id, kw, page, config_version):
+        return (group_id, kw, page, config_version, get_beijing_today(), self._generations.get(group_id, 0))
+
+    def result_key(self, group_id, kw):
+        """Identifies a result set: same group, keyword, day and roster generation."""
+        return (group_id, kw, get_beijing_today(), self._generations.get(group_id, 0))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, snapshot_id=None):
+        with self._lock:
+            # 生成号已变（渲染期间有失效）则不写入旧结果
+            if key[-1] != self._generations.get(key[0], 0):
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, snapshot_id)
+            if snapshot_id is not None:
+                self._by_snapshot.setdefault(snapshot_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, group_id):
+        with self._lock:
+            self._generations[group_id] = self._generations.get(group_id, 0) + 1
+            for key in [k for k in self._entries if k[0] == group_id]:
+                self._drop(key)
+
+    def discard_snapshots(self, snapshot_ids):
+        """Drop pages whose pagination buttons reference these (evicted) snapshots."""
+        with self._lock:
+            for sid in snapshot_ids:
+                for key in list(self._by_snapshot.get(sid, ())):
+                    self._drop(key)
+
+    def _drop(self, key):
+        _, _, sid = self._entries.pop(key)
+        keys = self._by_snapshot.get(sid) if sid is not None else None
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_snapshot[sid]
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+page_cache = QueryPageCache()
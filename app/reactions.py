@@ -0,0 +1,63 @@
+from .outbound import outbound, PRIORITY_REACTION
+import asyncio
+
+REACTION_QUEUE_SIZE = 1000  # Pending reactions beyond this are dropped
+REACTION_WORKERS = 2  # Concurrent setMessageReaction calls
+
+class ReactionQueue:
+    """
+    Bounded queue for auto-like reactions, drained by a few worker tasks.
+
+    Reactions go through the bot's own async HTTP client, so a burst of
+    messages neither starts executor threads nor opens new connections.
+    Reactions are cosmetic: when the queue is full new ones are dropped.
+    """
+
+    def __init__(self, maxsize=REACTION_QUEUE_SIZE, workers=REACTION_WORKERS):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._bot = None
+        self._queue = None
+        self._tasks = []
+
+    def start(self, bot):
+        """Start the workers; must be called on the bot loop."""
+        self._bot = bot
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def offer(self, chat_id, message_id, emoji):
+        """Queue a reaction without waiting. Returns False if it was dropped."""
+        emoji = (emoji or '').strip()
+        if not self._queue or not emoji:
+            return False
+        try:
+            self._queue.put_nowait((chat_id, message_id, emoji))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _send(self, chat_id, message_id, emoji):
+        await outbound.call(PRIORITY_REACTION, None, self._bot.set_message_reaction, block_key=chat_id,
+                            chat_id=chat_id, message_id=message_id, reaction=emoji)
+
+    async def _worker(self):
+        while True:
+            chat_id, message_id, emoji = await self._queue.get()
+            try:
+                await self._send(chat_id, message_id, emoji)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ [Like] 请求异常: {e}", flush=True)
+            finally:
+                self._queue.task_done()
+
+reaction_queue = ReactionQueue()
@@ -0,0 +1,107 @@
+from .models import BotGroup
+from .services import get_group_conf, get_group_fields
+from collections import namedtuple
+import itertools
+import threading
+
+# 群组快照：config / fields 已解析好，调用方只读不改
+GroupInfo = namedtuple('GroupInfo', 'id chat_id title is_active conf fields version')
+# 后台导航与群组列表用的只读行
+AdminGroup = namedtuple('AdminGroup', 'id chat_id title type is_active updated_at')
+
+_MISSING = object()
+NEGATIVE_CACHE_MAX = 1000  # Unregistered group chats remembered before the set is cleared
+
+class GroupRegistry:
+    """
+    In-process cache of bot groups keyed by chat_id.
+
+    Hot bot paths (on_message, pagination_callback) read groups from here so
+    plain chatter never reaches the database. Unknown group chats are
+    remembered (up to NEGATIVE_CACHE_MAX) until a group is registered; private
+    chats are never cached, since they can never be groups. Every write to a
+    group must call invalidate(), which also bumps `version` and drops the
+    admin panel's group list.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_chat = {}
+        self._unknown = set()  # group chat_ids with no BotGroup row
+        self._generation = 0
+        self._versions = itertools.count(1)
+        self._admin_list = None  # (generation, [AdminGroup], {id: AdminGroup})
+
+    @property
+    def version(self):
+        return self._generation
+
+    def cached(self, chat_id):
+        """Return (hit, info) without touching the database."""
+        key = str(chat_id)
+        info = self._by_chat.get(key, _MISSING)
+        if info is _MISSING:
+            return key in self._unknown, None
+        return True, info
+
+    def load(self, chat_id):
+        """Load a group from the database and cache it. Needs an app context."""
+        key = str(chat_id)
+        with self._lock:
+            generation = self._generation
+        g = BotGroup.query.filter_by(chat_id=key).first()
+        info = None
+        if g:
+            info = GroupInfo(g.id, g.chat_id, g.title, bool(g.is_active),
+                             get_group_conf(g), get_group_fields(g), next(self._versions))
+        with self._lock:
+            # 加载期间发生过失效则不回填，避免把旧数据写回缓存
+            if generation == self._generation:
+                if info is not None:
+                    self._by_chat[key] = info
+                elif key.startswith('-'):
+                    if len(self._unknown) >= NEGATIVE_CACHE_MAX:
+                        self._unknown.clear()
+                    self._unknown.add(key)
+        return info
+
+    def get(self, chat_id):
+        hit, info = self.cached(chat_id)
+        if hit:
+            return info
+        return self.load(chat_id)
+
+    def admin_groups(self):
+        """All groups, active and recently updated first. Needs an app context on a miss."""
+        with self._lock:
+            generation, cached = self._generation, self._admin_list
+        if cached and cached[0] == generation:
+            return cached[1]
+        groups = [AdminGroup(g.id, g.chat_id, g.title, g.type, bool(g.is_active), g.updated_at)
+                  for g in BotGroup.query.order_by(BotGroup.is_active.desc(), BotGroup.updated_at.desc()).all()]
+        with self._lock:
+            if generation == self._generation:
+                self._admin_list = (generation, groups, {g.id: g for g in groups})
+        return groups
+
+    def admin_group(self, group_id):
+        """One AdminGroup by primary key, from the cached list."""
+        groups = self.admin_groups()
+        cached = self._admin_list
+        if cached and cached[1] is groups:
+            return cached[2].get(group_id)
+        return next((g for g in groups if g.id == group_id), None)
+
+    def invalidate(self, chat_id=None):
+        """Drop one chat (or everything when chat_id is None)."""
+        with self._lock:
+            self._generation += 1
+            self._admin_list = None
+            if chat_id is None:
+                self._by_chat.clear()
+                self._unknown.clear()
+            else:
+                self._by_chat.pop(str(chat_id), None)
+                self._unknown.discard(str(chat_id))
+
+group_registry = GroupRegistry()
@@ -0,0 +1,153 @@
+from .models import GroupUser
+from .search import fold, value_ngrams, keyword_ngrams
+from .services import get_beijing_today
+from collections import Counter
+import bisect
+import json
+import threading
+
+def _profile_values(profile):
+    if not isinstance(profile, dict):
+        return []
+    return [fold(v) for v in profile.values() if v is not None and not isinstance(v, (dict, list))]
+
+class RosterEntry:
+    __slots__ = ('user_id', 'tg_id', 'profile', 'checkin_time', 'values')
+
+    def __init__(self, user_id, tg_id, profile, checkin_time):
+        self.user_id = user_id
+        self.tg_id = tg_id
+        self.profile = profile
+        self.checkin_time = checkin_time
+        self.values = _profile_values(profile)
+
+    def grams(self):
+        grams = set()
+        for v in self.values:
+            grams |= value_ngrams(v)
+        return grams
+
+    def matches(self, kw):
+        kw = fold(kw)
+        return any(kw in v for v in self.values)
+
+class _GroupRoster:
+    __slots__ = ('day', 'ids', 'entries', 'counts')
+
+    def __init__(self, day):
+        self.day = day
+        self.ids = []  # GroupUser.id ascending; pages read it from the end
+        self.entries = {}  # GroupUser.id -> RosterEntry
+        self.counts = Counter()  # profile gram -> number of users having it
+
+class TodayRoster:
+    """
+    Today's checked-in users per group, kept in memory.
+
+    Mirrors `online AND checkin_time >= today` ordered by id desc, so query
+    pages, keyword filters and the bare-text prefilter run without the
+    database. The roster is warmed once at startup; afterwards every
+    check-in goes through checked_in() and each group starts empty at
+    Beijing midnight. Until warm() succeeds callers fall back to SQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}
+        self.ready = False
+
+    def _state(self, group_id, today):
+        state = self._groups.get(group_id)
+        if state is None or state.day != today:
+            state = self._groups[group_id] = _GroupRoster(today)
+        return state
+
+    def _put(self, state, entry):
+        self._drop(state, entry.user_id)
+        bisect.insort(state.ids, entry.user_id)
+        state.entries[entry.user_id] = entry
+        state.counts.update(entry.grams())
+
+    def _drop(self, state, user_id):
+        old = state.entries.pop(user_id, None)
+        if old is None:
+            return
+        del state.ids[bisect.bisect_left(state.ids, user_id)]
+        grams = old.grams()
+        state.counts.subtract(grams)
+        for g in grams:
+            if state.counts[g] <= 0:
+                del state.counts[g]
+
+    def warm(self):
+        """Load today's check-ins of every group. Needs an app context."""
+        today = get_beijing_today()
+        rows = GroupUser.query.with_entities(
+            GroupUser.id, GroupUser.group_id, GroupUser.tg_id, GroupUser.profile_data, GroupUser.checkin_time
+        ).filter(GroupUser.online == True, GroupUser.checkin_time >= today).all()
+        loaded = []
+        for uid, gid, tg_id, raw, ts in rows:
+            try: profile = json.loads(raw) if raw else {}
+            except (ValueError, TypeError): profile = {}
+            loaded.append((gid, RosterEntry(uid, tg_id, profile, ts)))
+        with self._lock:
+            for gid, entry in loaded:
+                state = self._state(gid, today)
+                # 预热期间新打卡的用户已在内存里，保留内存版本
+                if entry.user_id not in state.entries:
+                    self._put(state, entry)
+            self.ready = True
+        return len(loaded)
+
+    def checked_in(self, group_id, user_id, tg_id, profile, checkin_time):
+        with self._lock:
+            self._put(self._state(group_id, get_beijing_today()), RosterEntry(user_id, tg_id, profile, checkin_time))
+
+    def profile_changed(self, group_id, user_id, profile):
+        """Refresh a user's profile if they are on today's roster."""
+        with self._lock:
+            state = self._state(group_id, get_beijing_today())
+            old = state.entries.get(user_id)
+            if old is not None:
+                self._put(state, RosterEntry(user_id, old.tg_id, profile, old.checkin_time))
+
+    def remove(self, group_id, user_id=None):
+        """Drop a deleted user, or a whole group when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._groups.pop(group_id, None)
+                return
+            state = self._groups.get(group_id)
+            if state is not None:
+                self._drop(state, user_id)
+
+    def might_match(self, group_id, kw):
+        """False when no profile can contain kw; None before warm()."""
+        if not self.ready:
+            return None
+        with self._lock:
+            counts = self._state(group_id, get_beijing_today()).counts
+            return all(g in counts for g in keyword_ngrams(kw))
+
+    def select(self, group_id, kw=None):
+        """Entries ordered by id desc, optionally containing kw; None before warm()."""
+        if not self.ready:
+            return None
+        with self._lock:
+            state = self._state(group_id, get_beijing_today())
+            entries = [state.entries[uid] for uid in reversed(state.ids)]
+        if kw:
+            entries = [e for e in entries if e.matches(kw)]
+        return entries
+
+    def lookup(self, group_id, user_ids):
+        """{user_id: (tg_id, profile)} for the ids on today's roster."""
+        with self._lock:
+            entries = self._state(group_id, get_beijing_today()).entries
+            return {uid: (entries[uid].tg_id, entries[uid].profile) for uid in user_ids if uid in entries}
+
+    def count(self, group_id):
+        with self._lock:
+            return len(self._state(group_id, get_beijing_today()).ids)
+
+today_roster = TodayRoster()
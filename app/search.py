@@ -0,0 +1,128 @@
+from . import db
+from .models import GroupUser, ProfileNgram
+from sqlalchemy import cast, func, literal, literal_column, select
+from sqlalchemy.dialects import postgresql
+import json
+import string
+
+# 资料值按字符切分为 1-gram 与 2-gram；关键词只需查它自己的 n-gram
+NGRAM_SIZE = 2
+REBUILD_BATCH_SIZE = 500
+
+# 搜索不区分 ASCII 大小写：索引、今日名单与 SQL 值校验都按同一规则折叠（SQLite 的 lower() 也只折叠 ASCII）
+_ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def fold(text):
+    """Normalize a profile value or keyword for matching: stripped, ASCII lowercased."""
+    return str(text).strip().translate(_ASCII_FOLD)
+
+def value_ngrams(value):
+    """All unigrams and bigrams of a profile value."""
+    v = fold(value)
+    grams = set(v)
+    grams.update(v[i:i + NGRAM_SIZE] for i in range(len(v) - NGRAM_SIZE + 1))
+    grams.discard('')
+    return grams
+
+def keyword_ngrams(kw):
+    """The grams a value must contain to possibly contain kw."""
+    kw = fold(kw)
+    if len(kw) < NGRAM_SIZE:
+        return {kw}
+    return {kw[i:i + NGRAM_SIZE] for i in range(len(kw) - NGRAM_SIZE + 1)}
+
+def _profile_rows(group_id, user_id, profile):
+    rows = []
+    if not isinstance(profile, dict):
+        return rows
+    for field, value in profile.items():
+        if value is None or isinstance(value, (dict, list)):
+            continue
+        for gram in value_ngrams(value):
+            rows.append({'group_id': group_id, 'user_id': user_id, 'field': str(field)[:50], 'gram': gram})
+    return rows
+
+def index_profile(group_id, user_id, profile):
+    """Replace the index rows of one user. Caller commits."""
+    ProfileNgram.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    rows = _profile_rows(group_id, user_id, profile)
+    if rows:
+        db.session.execute(ProfileNgram.__table__.insert(), rows)
+
+def index_profiles(group_id, profiles):
+    """Replace the index rows of many users ({user_id: profile}). Caller commits."""
+    if not profiles:
+        return
+    ProfileNgram.query.filter(ProfileNgram.user_id.in_(list(profiles))).delete(synchronize_session=False)
+    rows = []
+    for user_id, profile in profiles.items():
+        rows.extend(_profile_rows(group_id, user_id, profile))
+    if rows:
+        db.session.execute(ProfileNgram.__table__.insert(), rows)
+
+def unindex_users(user_ids=None, group_id=None):
+    """Drop index rows for deleted users or a deleted group. Caller commits."""
+    q = ProfileNgram.query
+    if group_id is not None:
+        q = q.filter(ProfileNgram.group_id == group_id)
+    if user_ids is not None:
+        q = q.filter(ProfileNgram.user_id.in_(list(user_ids)))
+    q.delete(synchronize_session=False)
+
+def _value_contains(kw):
+    """SQL EXISTS: some scalar value of the row's profile_data contains kw after fold()."""
+    if db.engine.dialect.name == 'postgresql':
+        values = func.jsonb_each(cast(GroupUser.profile_data, postgresql.JSONB)).table_valued('key', 'value')
+        scalar = func.jsonb_typeof(values.c.value).in_(['string', 'number'])
+        folded = func.translate(func.trim(values.c.value.op('#>>')(literal_column("'{}'"))),
+                                string.ascii_uppercase, string.ascii_lowercase)
+    else:
+        values = func.json_each(GroupUser.profile_data).table_valued('value', 'type')
+        scalar = values.c.type.in_(['text', 'integer', 'real'])
+        folded = func.lower(func.trim(values.c.value))
+    return select(literal(1)).select_from(values).where(scalar, folded.contains(kw, autoescape=True)).exists()
+
+def keyword_filter(group_id, kw):
+    """
+    SQL criteria matching users whose profile values contain kw.
+
+    The n-gram index narrows the candidates; keywords longer than one gram
+    are re-checked value by value on those candidates only, because bigrams
+    can match out of order. Matching ignores ASCII case, like the roster.
+    """
+    kw = fold(kw)
+    grams = keyword_ngrams(kw)
+    candidates = db.session.query(ProfileNgram.user_id).filter(
+        ProfileNgram.group_id == group_id,
+        ProfileNgram.gram.in_(grams)
+    ).group_by(ProfileNgram.user_id, ProfileNgram.field).having(
+        func.count(func.distinct(ProfileNgram.gram)) == len(grams)
+    )
+    criteria = [GroupUser.id.in_(candidates)]
+    if len(kw) > NGRAM_SIZE:
+        criteria.append(_value_contains(kw))
+    return criteria
+
+def rebuild_profile_index(conn):
+    """Backfill the index for every user on `conn`; used once when the table is empty. Caller commits."""
+    users_t, ngrams_t = GroupUser.__table__, ProfileNgram.__table__
+    conn.execute(ngrams_t.delete())
+    last_id = 0
+    total = 0
+    while True:
+        users = conn.execute(
+            select(users_t.c.id, users_t.c.group_id, users_t.c.profile_data)
+            .where(users_t.c.id > last_id).order_by(users_t.c.id).limit(REBUILD_BATCH_SIZE)
+        ).all()
+        if not users:
+            break
+        rows = []
+        for uid, gid, raw in users:
+            try: profile = json.loads(raw) if raw else {}
+            except (ValueError, TypeError): profile = {}
+            rows.extend(_profile_rows(gid, uid, profile))
+        if rows:
+            conn.execute(ngrams_t.insert(), rows)
+        last_id = users[-1][0]
+        total += len(users)
+    return total
@@ -1,6 +1,119 @@
 from . import db
+from .models import DEFAULT_FIELDS, DEFAULT_SYSTEM
+from functools import lru_cache
+from datetime import datetime
 import json
 import re
+import pytz
+
+# Beijing timezone
+BEIJING_TZ = pytz.timezone('Asia/Shanghai')
+
+def get_beijing_now():
+    """Get current time in Beijing timezone as naive datetime (for database storage)"""
+    return datetime.now(BEIJING_TZ).replace(tzinfo=None)
+
+def get_beijing_today():
+    """Get today's date at midnight in Beijing timezone as naive datetime"""
+    now = datetime.now(BEIJING_TZ)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+def get_group_conf(group):
+    conf = DEFAULT_SYSTEM.copy()
+    if group and group.config:
+        try:
+            c = json.loads(group.config)
+            if isinstance(c, dict) and 'config' in c: c = c['config']
+            for k, v in c.items():
+                if v is not None: conf[k] = v
+        except: pass
+    return conf
+
+def get_group_fields(group):
+    if group and group.fields_config:
+        try: return json.loads(group.fields_config)
+        except: pass
+    return DEFAULT_FIELDS
+
+# --- 消息模板 ---
+# 模板在首次使用时解析为“字面量 + 占位槽”的渲染计划并缓存，渲染时单次拼接、不跑正则
+_PLACEHOLDER_PATTERN = re.compile(r'\{(.*?)\}')
+_SPECIAL_SLOTS = {'onlineEmoji': 'emoji', '序号': 'seq', 'tg_id': 'tg_id'}
+
+def template_fields(fields):
+    """Hashable (key, label) pairs of a fields config, for compile_template."""
+    return tuple((f.get('key'), f.get('label')) for f in fields if isinstance(f, dict))
+
+@lru_cache(maxsize=256)
+def compile_template(tpl, field_items, keep_unknown=False):
+    """
+    Parse a template into a render plan of literal strings and slot tuples.
+
+    {onlineEmoji}, {序号} and {tg_id} are special slots and {<label>} maps to
+    the field with that label. With keep_unknown (push cards) a placeholder
+    may also name a profile key directly, and unmatched ones stay as written;
+    otherwise (roster lines) unmatched placeholders are dropped.
+    """
+    label_keys = {}
+    for key, label in field_items:
+        label_keys.setdefault(label, key)
+    plan = []
+    last = 0
+    for m in _PLACEHOLDER_PATTERN.finditer(tpl):
+        if m.start() > last:
+            plan.append(tpl[last:m.start()])
+        last = m.end()
+        name = m.group(1)
+        if name in _SPECIAL_SLOTS:
+            plan.append((_SPECIAL_SLOTS[name],))
+        elif keep_unknown:
+            plan.append(('key', name, label_keys.get(name)))
+        elif name in label_keys:
+            plan.append(('field', label_keys[name]))
+    if last < len(tpl):
+        plan.append(tpl[last:])
+    return tuple(plan)
+
+def render_plan(plan, profile, tg_id='', seq='', emoji=''):
+    """Render a compiled plan for one user in a single pass."""
+    out = []
+    for seg in plan:
+        if seg.__class__ is str:
+            out.append(seg)
+            continue
+        kind = seg[0]
+        if kind == 'field':
+            out.append(str(profile.get(seg[1], '')))
+        elif kind == 'emoji':
+            out.append(emoji)
+        elif kind == 'seq':
+            out.append(str(seq))
+        elif kind == 'tg_id':
+            out.append(str(tg_id))
+        elif seg[1] in profile:
+            out.append(str(profile[seg[1]]))
+        elif seg[2] is not None:
+            out.append(str(profile.get(seg[2], '')))
+        else:
+            out.append('{' + seg[1] + '}')
+    return ''.join(out)
+
+# --- Telegram HTML 清洗 ---
+# Telegram 支持的无属性标签
+_ALLOWED_TAGS = frozenset({
+    'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del',
+    'code', 'pre', 'tg-spoiler', 'tg-emoji'
+})
+# Matches opening, closing and self-closing tags
+_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z][\w-]*)((?:\s+[^>]*)?)>')
+_HREF_PATTERN = re.compile(r'href\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+_CLASS_PATTERN = re.compile(r'class\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+# 任何不是"无属性、小写的允许标签"的标签；找不到时清洗结果与原文相同
+_NEEDS_WORK = re.compile(r'<(?!/?(?:%s)>)/?[a-zA-Z]' % '|'.join(sorted(_ALLOWED_TAGS, key=len, reverse=True)))
+
+# 配置类文案（打卡成功、重复打卡、表头等）反复出现，短文本走 LRU 缓存
+SANITIZE_CACHE_SIZE = 512
+SANITIZE_CACHE_MAX_LEN = 1024
 
 def sanitize_html_for_telegram(text):
     """
@@ -18,84 +131,57 @@ def sanitize_html_for_telegram(text):
     - <tg-emoji> - custom emoji
     
     All other tags will be removed while preserving their content.
+    Short inputs are memoized; long ones (rendered rosters) are not.
     """
-    if not text:
+    if not text or '<' not in text:
         return text
-    
-    # List of allowed tags (without attributes, except special cases)
-    allowed_tags = {
-        'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del',
-        'code', 'pre', 'tg-spoiler', 'tg-emoji'
-    }
-    
-    # Pattern to match HTML tags
-    # This will match opening tags, closing tags, and self-closing tags
-    tag_pattern = r'<(/?)([a-zA-Z][\w-]*)((?:\s+[^>]*)?)>'
-    
+    if len(text) <= SANITIZE_CACHE_MAX_LEN:
+        return _sanitize_cached(text)
+    return _sanitize(text)
+
+def _sanitize(text):
+    # 只含 <b>、<code> 这类已合规标签的文本（大多数名单）原样返回
+    if not _NEEDS_WORK.search(text):
+        return text
+    # split() yields [text, closing, name, attributes, text, ...]
+    parts = _TAG_PATTERN.split(text)
     # Track which special tags (a, span) have valid openings
-    # We need to track opening tags to know if closing tags are valid
+    # so that only their matching closing tags are kept
     valid_openings = []
-    result_parts = []
-    last_end = 0
+    result_parts = [parts[0]]
+    append = result_parts.append
     
-    for match in re.finditer(tag_pattern, text):
-        # Add text before this tag
-        result_parts.append(text[last_end:match.start()])
-        last_end = match.end()
-        
-        is_closing = match.group(1)  # '/' if closing tag, '' if opening
-        tag_name = match.group(2).lower()
-        attributes = match.group(3)  # Everything between tag name and >
+    for i in range(1, len(parts), 4):
+        is_closing, tag_name, attributes, tail = parts[i], parts[i + 1].lower(), parts[i + 2], parts[i + 3]
         
-        # Special handling for <a> tags - keep href attribute
-        if tag_name == 'a':
+        if tag_name in _ALLOWED_TAGS:
+            # Allowed tags are kept without attributes
+            append(f'<{is_closing}{tag_name}>')
+        elif tag_name == 'a':
             if not is_closing:
-                # Extract href attribute if present
-                href_match = re.search(r'href\s*=\s*["\']([^"\']*)["\']', attributes, re.IGNORECASE)
+                # Keep only the href attribute; <a> without href is dropped
+                href_match = _HREF_PATTERN.search(attributes)
                 if href_match:
-                    href_value = href_match.group(1)
-                    # Escape any quotes in href
-                    href_value = href_value.replace('"', '&quot;')
-                    result_parts.append(f'<a href="{href_value}">')
+                    href_value = href_match.group(1).replace('"', '&quot;')
+                    append(f'<a href="{href_value}">')
                     valid_openings.append('a')
-                else:
-                    # <a> without href is invalid, remove it
-                    pass
-            else:
-                # Closing </a> tag - only keep if we have a valid opening
-                if valid_openings and valid_openings[-1] == 'a':
-                    result_parts.append('</a>')
-                    valid_openings.pop()
-            continue
-        
-        # Special handling for <span> tags - only allow with class="tg-spoiler"
-        if tag_name == 'span':
+            elif valid_openings and valid_openings[-1] == 'a':
+                append('</a>')
+                valid_openings.pop()
+        elif tag_name == 'span':
             if not is_closing:
-                # Check if it has class="tg-spoiler"
-                # Use proper regex to extract class attribute value
-                class_match = re.search(r'class\s*=\s*["\']([^"\']*)["\']', attributes, re.IGNORECASE)
-                if class_match and 'tg-spoiler' == class_match.group(1).strip():
-                    result_parts.append('<span class="tg-spoiler">')
+                # Only <span class="tg-spoiler"> is supported
+                class_match = _CLASS_PATTERN.search(attributes)
+                if class_match and class_match.group(1).strip() == 'tg-spoiler':
+                    append('<span class="tg-spoiler">')
                     valid_openings.append('span')
-                else:
-                    # Invalid span tag, remove but keep content
-                    pass
-            else:
-                # Closing </span> tag - only keep if we have a valid opening
-                if valid_openings and valid_openings[-1] == 'span':
-                    result_parts.append('</span>')
-                    valid_openings.pop()
-            continue
-        
-        # For allowed tags, return them without attributes
-        if tag_name in allowed_tags:
-            result_parts.append(f'<{is_closing}{tag_name}>')
-            continue
-        
-        # For disallowed tags, remove them but keep their content
-        # (do nothing, just skip the tag)
-    
-    # Add remaining text after last tag
-    result_parts.append(text[last_end:])
+            elif valid_openings and valid_openings[-1] == 'span':
+                append('</span>')
+                valid_openings.pop()
+        # Disallowed tags are removed but their content is kept
+        if tail:
+            append(tail)
     
     return ''.join(result_parts)
+
+_sanitize_cached = lru_cache(maxsize=SANITIZE_CACHE_SIZE)(_sanitize)
@@ -0,0 +1,81 @@
+from .page_cache import PAGE_CACHE_TTL
+from collections import OrderedDict, namedtuple
+import secrets
+import threading
+import time
+
+# 快照 TTL 不短于查询页缓存 TTL：缓存里的第一页按钮引用的快照不会先过期
+SNAPSHOT_TTL = max(1800, PAGE_CACHE_TTL)  # Seconds a result snapshot can be paged
+SNAPSHOT_MAX = 4096  # Snapshots kept across all groups
+
+# 快照只记查询条件与截止时间（as_of 之后打卡的人不计入），不存 id 列表，大小与群人数无关
+QuerySnapshot = namedtuple('QuerySnapshot', 'group_id kw day as_of')
+
+class SnapshotStore:
+    """
+    Recent queries frozen at a point in time, addressed by a short random id.
+
+    A snapshot is the query (group, keyword, day) plus the time it was taken;
+    its pages are the users checked in by then, read page by page from the
+    roster or with LIMIT/OFFSET. The pagination buttons carry only the
+    snapshot id and page number, so page flips keep a stable result. One
+    snapshot is shared per result key (see find()). Listeners hear about
+    every snapshot dropped for age or count, so a cached first page never
+    keeps buttons to a snapshot that is gone.
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL, maxsize=SNAPSHOT_MAX):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # sid -> (expires_at, QuerySnapshot, key)
+        self._by_key = {}  # result key -> sid
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """Call fn(sids) with the snapshot ids each create() evicts."""
+        self._listeners.append(fn)
+
+    def find(self, key):
+        """(sid, snapshot) created for `key` that outlives a cached page, else (None, None)."""
+        with self._lock:
+            sid = self._by_key.get(key)
+            entry = self._entries.get(sid) if sid is not None else None
+        if entry is None or entry[0] < time.monotonic() + PAGE_CACHE_TTL:
+            return None, None
+        return sid, entry[1]
+
+    def create(self, snapshot, key=None):
+        """Store a QuerySnapshot; find(key) returns it while it has time left."""
+        sid = secrets.token_urlsafe(6)  # 8 chars, fits callback_data with room to spare
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            self._entries[sid] = (now + self.ttl, snapshot, key)
+            if key is not None:
+                self._by_key[key] = sid
+            # 按创建顺序排列，过期的和超量的都从头部淘汰
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if oldest[0] >= now and len(self._entries) <= self.maxsize:
+                    break
+                old_sid, (_, _, old_key) = self._entries.popitem(last=False)
+                if old_key is not None and self._by_key.get(old_key) == old_sid:
+                    del self._by_key[old_key]
+                evicted.append(old_sid)
+        if evicted:
+            for fn in self._listeners:
+                fn(evicted)
+        return sid
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+snapshot_store = SnapshotStore()
@@ -0,0 +1,141 @@
+from . import db
+from .models import GroupUser, GroupDailyStats
+from .roster import today_roster
+from .services import get_beijing_now, get_beijing_today
+from sqlalchemy import func, case
+from datetime import timedelta
+import asyncio
+import threading
+import time
+
+EXPIRING_SOON_DAYS = 7  # "Expiring soon" window on the dashboard and user filters
+STATS_REFRESH_SECONDS = 600  # Recount the expiring-soon window this often
+STATS_ROLLUP_SECONDS = 600  # Rewrite today's group_daily_stats rows this often
+
+class GroupStats:
+    """
+    Dashboard counters per group: registered, banned, expiring soon, checked in today.
+
+    registered and banned are counted once and then moved by deltas from the
+    code paths that add, delete, ban and unban users. The expiring-soon count
+    depends on the clock, so it is recounted for all groups at most every
+    STATS_REFRESH_SECONDS with one range scan of the expiry index. Checked-in
+    counts come from the in-memory roster.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # group_id -> [registered, banned]
+        self._generation = {}  # group_id -> bumped by every adjust/invalidate
+        self._expiring = {}
+        self._expiring_at = 0.0
+
+    def adjust(self, group_id, registered=0, banned=0):
+        with self._lock:
+            self._generation[group_id] = self._generation.get(group_id, 0) + 1
+            totals = self._totals.get(group_id)
+            if totals is not None:
+                totals[0] += registered
+                totals[1] += banned
+
+    def invalidate(self, group_id):
+        """Recount a group on the next read (after imports and other bulk writes)."""
+        with self._lock:
+            self._generation[group_id] = self._generation.get(group_id, 0) + 1
+            self._totals.pop(group_id, None)
+        self.expiry_changed()
+
+    def expiry_changed(self):
+        self._expiring_at = 0.0
+
+    def _load_totals(self, group_ids):
+        with self._lock:
+            generations = {gid: self._generation.get(gid, 0) for gid in group_ids}
+        rows = db.session.query(
+            GroupUser.group_id, func.count(GroupUser.id), func.sum(case((GroupUser.is_banned == True, 1), else_=0))
+        ).filter(GroupUser.group_id.in_(group_ids)).group_by(GroupUser.group_id).all()
+        loaded = {gid: [0, 0] for gid in group_ids}
+        for gid, registered, banned in rows:
+            loaded[gid] = [registered, int(banned or 0)]
+        with self._lock:
+            for gid, totals in loaded.items():
+                # 统计期间有增量变动则不回填，下次读取再数
+                if generations[gid] == self._generation.get(gid, 0):
+                    self._totals[gid] = totals
+        return loaded
+
+    def _load_expiring(self):
+        now = get_beijing_now()
+        rows = db.session.query(GroupUser.group_id, func.count(GroupUser.id)).filter(
+            GroupUser.is_banned == False,
+            GroupUser.expiration_date.isnot(None),
+            GroupUser.expiration_date >= now,
+            GroupUser.expiration_date < now + timedelta(days=EXPIRING_SOON_DAYS)
+        ).group_by(GroupUser.group_id).all()
+        self._expiring = dict(rows)
+        self._expiring_at = time.monotonic()
+
+    def _checked_in(self, group_id):
+        if today_roster.ready:
+            return today_roster.count(group_id)
+        return GroupUser.query.filter(
+            GroupUser.group_id == group_id, GroupUser.online == True, GroupUser.checkin_time >= get_beijing_today()
+        ).count()
+
+    def get_many(self, group_ids):
+        """{group_id: counters}. Needs an app context only when something must be (re)counted."""
+        missing = [gid for gid in group_ids if gid not in self._totals]
+        loaded = self._load_totals(missing) if missing else {}
+        if time.monotonic() - self._expiring_at > STATS_REFRESH_SECONDS:
+            self._load_expiring()
+        result = {}
+        for gid in group_ids:
+            registered, banned = self._totals.get(gid) or loaded[gid]
+            result[gid] = {
+                'registered': registered,
+                'banned': banned,
+                'expiring': self._expiring.get(gid, 0),
+                'checked_in': self._checked_in(gid),
+            }
+        return result
+
+    def get(self, group_id):
+        return self.get_many([group_id])[group_id]
+
+    def rollup(self, group_ids):
+        """Rewrite today's group_daily_stats rows. Needs an app context."""
+        if not group_ids:
+            return 0
+        day = get_beijing_today().date()
+        now = get_beijing_now()
+        counters = self.get_many(group_ids)
+        GroupDailyStats.query.filter(GroupDailyStats.day == day, GroupDailyStats.group_id.in_(group_ids)).delete(synchronize_session=False)
+        db.session.execute(GroupDailyStats.__table__.insert(), [
+            dict(c, group_id=gid, day=day, updated_at=now) for gid, c in counters.items()
+        ])
+        db.session.commit()
+        return len(counters)
+
+    def history(self, group_id, days):
+        """Daily rows of the last `days` days, oldest first. Needs an app context."""
+        since = get_beijing_today().date() - timedelta(days=days - 1)
+        rows = GroupDailyStats.query.filter(
+            GroupDailyStats.group_id == group_id, GroupDailyStats.day >= since
+        ).order_by(GroupDailyStats.day).all()
+        return [{'day': r.day.isoformat(), 'registered': r.registered, 'checked_in': r.checked_in,
+                 'banned': r.banned, 'expiring': r.expiring} for r in rows]
+
+    def start(self, flask_app, run_db, active_group_ids):
+        """Start the periodic rollup; must be called on the bot loop. active_group_ids() needs an app context."""
+        asyncio.get_running_loop().create_task(self._rollup_loop(flask_app, run_db, active_group_ids))
+
+    async def _rollup_loop(self, flask_app, run_db, active_group_ids):
+        # 当天的行每隔一段时间整体覆盖，零点后自然开始写新的一天
+        while True:
+            try:
+                await run_db(flask_app, lambda: self.rollup(active_group_ids()))
+            except Exception as e:
+                print(f"❌ 群统计汇总写入失败: {e}", flush=True)
+            await asyncio.sleep(STATS_ROLLUP_SECONDS)
+
+group_stats = GroupStats()
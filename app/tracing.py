@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+import contextvars
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+SLOW_UPDATE_MS = int(os.getenv('SLOW_UPDATE_MS', 2000))  # Log a stage breakdown for updates slower than this; 0 disables
+PROFILE_MAX_UPDATES = 100  # Upper bound for one profiling request from the admin panel
+PROFILE_TOP = 40  # Functions / allocation sites kept in the text report
+
+class UpdateTrace:
+    """Per-update state shared by metrics, spans and the slow-update log."""
+    __slots__ = ('handler', 'queries', 'db_seconds', 'stages')
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.stages = {}  # stage -> seconds, in first-seen order
+
+# 当前更新的 trace；run_db 复制 context，DB 线程里的 span 与 SQL 也记到同一个对象上
+current_update = contextvars.ContextVar('current_update', default=None)
+
+def set_handler(handler):
+    """Relabel the current update once the handler knows what it is (checkin / query)."""
+    trace = current_update.get()
+    if trace is not None:
+        trace.handler = handler
+
+@contextmanager
+def span(stage):
+    """Add the time spent in the block to the current update's `stage`; no-op outside an update."""
+    trace = current_update.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + time.perf_counter() - start
+
+def log_if_slow(trace, elapsed):
+    if not SLOW_UPDATE_MS or elapsed * 1000 < SLOW_UPDATE_MS:
+        return
+    stages = ' '.join(f"{k}={v * 1000:.0f}ms" for k, v in trace.stages.items()) or '-'
+    print(f"🐢 慢更新 [{trace.handler}] {elapsed * 1000:.0f}ms | SQL {trace.queries} 条 / {trace.db_seconds * 1000:.0f}ms | {stages}", flush=True)
+
+class ProfileSampler:
+    """
+    Admin-armed profiling of the next N bot updates.
+
+    cProfile samples accumulate into one pstats report; tracemalloc samples
+    record the allocations each update left behind. Only one update is
+    captured at a time, and a cProfile capture sees everything the bot loop
+    thread runs meanwhile (other updates included) but not the DB threads -
+    use the span breakdown for those.
+    """
+
+    MODES = ('cprofile', 'tracemalloc')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mode = None
+        self._remaining = 0
+        self._busy = False
+        self._captured = 0
+        self._stats = None
+        self._sections = []
+
+    def arm(self, mode, updates):
+        """Start a new capture of `updates` updates (mode None stops it); earlier results are dropped."""
+        with self._lock:
+            self._mode = mode
+            self._remaining = min(max(int(updates), 0), PROFILE_MAX_UPDATES) if mode else 0
+            self._captured = 0
+            self._stats = None
+            self._sections = []
+
+    def status(self):
+        with self._lock:
+            return {'mode': self._mode, 'remaining': self._remaining, 'captured': self._captured}
+
+    @contextmanager
+    def capture(self, trace):
+        with self._lock:
+            if not self._remaining or self._busy:
+                mode = None
+            else:
+                mode = self._mode
+                self._remaining -= 1
+                self._busy = True
+        if mode is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            if mode == 'cprofile':
+                with self._cprofile():
+                    yield
+            else:
+                with self._tracemalloc(trace, start):
+                    yield
+        finally:
+            with self._lock:
+                self._busy = False
+                self._captured += 1
+
+    @contextmanager
+    def _cprofile(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    @contextmanager
+    def _tracemalloc(self, trace, start):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            diff = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            if started:
+                tracemalloc.stop()
+            lines = [f"# {trace.handler} {(time.perf_counter() - start) * 1000:.0f}ms"]
+            lines += [str(d) for d in diff[:PROFILE_TOP]]
+            with self._lock:
+                self._sections.append('\n'.join(lines))
+
+    def report(self):
+        """Text report of everything captured since the last arm()."""
+        with self._lock:
+            head = f"mode={self._mode} captured={self._captured} remaining={self._remaining}\n\n"
+            if self._stats is not None:
+                buf = io.StringIO()
+                self._stats.stream = buf
+                self._stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+                return head + buf.getvalue()
+            return head + '\n\n'.join(self._sections)
+
+    def dump(self):
+        """Raw cProfile stats (the .prof format pstats / snakeviz read), or None."""
+        with self._lock:
+            return marshal.dumps(self._stats.stats) if self._stats is not None else None
+
+profiler = ProfileSampler()
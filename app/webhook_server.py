@@ -0,0 +1,96 @@
+from telegram import Update
+import asyncio
+import json
+
+WEBHOOK_PATH = '/core/webhook'
+MAX_BODY_BYTES = 1024 * 1024  # Telegram updates are far smaller
+KEEPALIVE_TIMEOUT = 75  # Seconds an idle keep-alive connection stays open
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+class WebhookServer:
+    """
+    Minimal HTTP/1.1 listener for Telegram webhooks, running on the bot loop.
+
+    Updates are decoded and put on the ingress queue without leaving the
+    loop, so there is no WSGI request and no thread hop per update. It only
+    answers POST on WEBHOOK_PATH; Flask keeps serving the admin UI.
+    """
+
+    def __init__(self, ptb_app, ingress, host='0.0.0.0', port=8443, path=WEBHOOK_PATH):
+        self.ptb_app = ptb_app
+        self.ingress = ingress
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, reuse_address=True)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        k, v = line.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = version.strip() == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status = self._dispatch(method, target.split('?', 1)[0], body)
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, method, path, body):
+        if path != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        try:
+            update = Update.de_json(json.loads(body), self.ptb_app.bot)
+        except Exception as e:
+            # 与 Flask 入口一致：坏数据也返回 200，避免 Telegram 无限重投
+            print(f"❌ Webhook Error: {e}")
+            return 200
+        return 200 if self.ingress.offer(update) else 503
+
+    async def _respond(self, writer, status, keep_alive):
+        reason = _REASONS.get(status, '')
+        body = reason.encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: text/plain\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
@@ -1,29 +1,28 @@
-from app import create_app, db
+from app import create_app
+from app.migrations import run_migrations
+from app.checkin_buffer import checkin_buffer
 import threading
 import asyncio
+import atexit
+import signal
 import os
 import sys
 import time
-from sqlalchemy import text
 
 app = create_app()
 
-def fix_database_schema(app):
-    time.sleep(3)
+# 迁移完成后再启动机器人，替代原先的固定等待
+schema_ready = threading.Event()
+
+def migrate_database(app):
     with app.app_context():
         try:
-            db.create_all()
-            with db.engine.connect() as conn:
-                try: conn.execute(text("ALTER TABLE bot_groups ADD COLUMN last_query_msg_id INTEGER"))
-                except: pass
-                try: conn.execute(text("ALTER TABLE group_users ADD COLUMN expiration_date TIMESTAMP"))
-                except: pass
-                try: conn.execute(text("ALTER TABLE group_users ADD COLUMN is_banned BOOLEAN DEFAULT FALSE"))
-                except: pass
-                conn.commit()
-            print("✅ [后台] 数据库结构检查完成", flush=True)
+            version = run_migrations()
+            print(f"✅ [后台] 数据库结构检查完成 (schema v{version})", flush=True)
         except Exception as e:
-            print(f"⚠️ [后台] 数据库检查跳过: {e}", flush=True)
+            print(f"⚠️ [后台] 数据库迁移失败: {e}", flush=True)
+        finally:
+            schema_ready.set()
 
 def run_flask():
     port = int(os.getenv('PORT', 5000))
@@ -33,7 +32,7 @@ def start_bot_process_forever(flask_app):
     """
     启动一个永不退出的事件循环，供 Webhook 使用
     """
-    time.sleep(3)
+    schema_ready.wait()
     from app.modules.core.routes import run_bot
     
     print("🤖 启动机器人后台循环...", flush=True)
@@ -56,8 +55,8 @@ if __name__ == '__main__':
     flask_thread = threading.Thread(target=run_flask, daemon=True)
     flask_thread.start()
     
-    # 2. 数据库修复
-    db_thread = threading.Thread(target=fix_database_schema, args=(app,), daemon=True)
+    # 2. 数据库迁移
+    db_thread = threading.Thread(target=migrate_database, args=(app,), daemon=True)
     db_thread.start()
     
     # 3. 启动机器人 (在独立线程中跑 loop_forever)
@@ -65,6 +64,10 @@ if __name__ == '__main__':
     bot_thread = threading.Thread(target=start_bot_process_forever, args=(app,), daemon=True)
     bot_thread.start()
     
+    # 退出（含 SIGTERM）前把尚未落库的打卡写入数据库
+    atexit.register(checkin_buffer.flush_on_exit, app)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    
     # 4. 主线程死循环保活
     try:
         while True:
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Flask app on a throwaway SQLite file; the schema is left to the test."""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'bot.db'}")
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    from app import create_app
+    flask_app = create_app()
+    with flask_app.app_context():
+        yield flask_app
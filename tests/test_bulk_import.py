@@ -0,0 +1,37 @@
+from app import db
+from app.bulk import import_users
+from app.models import GroupUser, BotGroup, DEFAULT_FIELDS
+from app.search import keyword_filter, index_profile
+import io
+import json
+
+def _profile(tg_id):
+    return json.loads(GroupUser.query.filter_by(tg_id=tg_id).one().profile_data)
+
+def test_reimport_merges_into_existing_profiles(app):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    for tg_id in (1, 2):
+        u = GroupUser(group_id=group.id, tg_id=tg_id, profile_data=json.dumps({'name': f'老{tg_id}', 'region': '福田'}))
+        db.session.add(u)
+        db.session.flush()
+        index_profile(group.id, u.id, json.loads(u.profile_data))
+    db.session.commit()
+
+    # 第 1 行改昵称、地区留空；第 2 行没有地区列；第 3 行是新用户
+    upload = io.BytesIO("tg_id,name,region\n1,新1,\n3,新3,南山\n".encode())
+    saved = {}
+    imported, errors = import_users(group.id, DEFAULT_FIELDS, upload, 'csv', on_chunk=saved.update)
+    upload = io.BytesIO('{"tg_id": 2, "name": "新2"}\n'.encode())
+    imported2, _ = import_users(group.id, DEFAULT_FIELDS, upload, 'jsonl', on_chunk=saved.update)
+
+    assert (imported, errors, imported2) == (2, [], 1)
+    assert _profile(1) == {'name': '新1', 'region': '福田'}
+    assert _profile(2) == {'name': '新2', 'region': '福田'}
+    assert _profile(3) == {'name': '新3', 'region': '南山'}
+    # 回调与 n-gram 索引拿到的是合并后的资料
+    assert sorted(r['profile']['region'] for r in saved.values()) == ['南山', '福田', '福田']
+    matched = GroupUser.query.filter(*keyword_filter(group.id, '福田')).with_entities(GroupUser.tg_id).all()
+    assert sorted(t for (t,) in matched) == [1, 2]
@@ -0,0 +1,28 @@
+from app import db
+from app.checkin_buffer import CheckinBuffer
+from app.models import GroupUser, BotGroup
+from datetime import datetime
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+def test_flush_skips_deleted_users_without_requeue(app):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    kept, gone = GroupUser(group_id=group.id, tg_id=1), GroupUser(group_id=group.id, tg_id=2)
+    db.session.add_all([kept, gone])
+    db.session.commit()
+    kept_id, gone_id = kept.id, gone.id
+
+    buffer = CheckinBuffer()
+    assert buffer.claim(kept_id, group.id, NOW, NOW.date())
+    assert buffer.claim(gone_id, group.id, NOW, NOW.date())
+    GroupUser.query.filter_by(id=gone_id).delete()
+    db.session.commit()
+
+    buffer.flush()
+    assert buffer.pending_count() == 0
+    db.session.expire_all()
+    row = db.session.get(GroupUser, kept_id)
+    assert row.online and row.checkin_time == NOW
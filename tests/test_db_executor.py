@@ -0,0 +1,55 @@
+from app import db
+import app.db_executor as db_executor
+from app.db_executor import run_db, init_async_engine
+from app.models import GroupUser, BotGroup
+from app.tracing import UpdateTrace, current_update
+import asyncio
+import threading
+import pytest
+
+def _seed():
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    db.session.add_all([GroupUser(group_id=group.id, tg_id=n) for n in range(5)])
+    db.session.commit()
+    return group.id
+
+def _ban(group_id, tg_id):
+    u = GroupUser.query.filter_by(group_id=group_id, tg_id=tg_id).first()
+    u.is_banned = True
+    db.session.commit()
+    return u.id
+
+def _banned(group_id):
+    return sorted(tg for (tg,) in db.session.query(GroupUser.tg_id).filter_by(group_id=group_id, is_banned=True))
+
+@pytest.fixture(params=['executor', 'async'])
+def mode(request, app, tmp_path, monkeypatch):
+    monkeypatch.setattr(db_executor, '_async_sessions', None)
+    if request.param == 'async':
+        pytest.importorskip('aiosqlite')
+        assert init_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    return request.param
+
+def test_units_commit_and_are_traced(app, mode):
+    group_id = _seed()
+
+    async def _update(tg_id):
+        trace = UpdateTrace('test')
+        current_update.set(trace)
+        await run_db(app, _ban, group_id, tg_id)
+        return trace.queries
+
+    async def _main():
+        queries = await asyncio.gather(*[_update(n) for n in (1, 3)])
+        thread = await run_db(app, lambda: threading.current_thread().name)
+        return queries, thread, await run_db(app, _banned, group_id)
+
+    queries, thread, banned = asyncio.run(_main())
+    # 异步引擎下单元在 Loop 线程上执行，不占 DB 线程池
+    assert thread.startswith('bot-db') == (mode == 'executor')
+    assert banned == [1, 3]
+    # 每个更新的 SQL 计到它自己的 trace 上
+    assert all(q >= 2 for q in queries)
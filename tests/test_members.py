@@ -0,0 +1,38 @@
+from app import db
+from app.members import MemberCache
+from app.models import GroupUser, BotGroup
+
+def test_members_answered_from_memory_until_deleted(app):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    db.session.add(GroupUser(group_id=group.id, tg_id=1))
+    db.session.commit()
+
+    cache = MemberCache()
+    assert cache.is_member(group.id, 1) is None
+    assert cache.lookup(group.id, 1) is True
+    assert cache.is_member(group.id, 1) is True
+    # 非成员也缓存，新增成员提交后 forget() 清掉
+    assert cache.lookup(group.id, 2) is False
+    assert cache.is_member(group.id, 2) is False
+    db.session.add(GroupUser(group_id=group.id, tg_id=2))
+    db.session.commit()
+    cache.forget(group.id, [2])
+    assert cache.is_member(group.id, 2) is None
+    assert cache.lookup(group.id, 2) is True
+
+    GroupUser.query.filter_by(group_id=group.id, tg_id=1).delete()
+    db.session.commit()
+    cache.forget(group.id, [1])
+    assert cache.is_member(group.id, 1) is None
+    assert cache.lookup(group.id, 1) is False
+
+def test_forget_whole_group():
+    cache = MemberCache()
+    with cache._lock:
+        cache._members.update({(1, 1): True, (1, 2): False, (2, 1): False})
+    cache.forget(1)
+    assert cache.is_member(1, 1) is None and cache.is_member(1, 2) is None
+    assert cache.is_member(2, 1) is False
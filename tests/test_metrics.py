@@ -0,0 +1,15 @@
+from app.metrics import MetricsRegistry
+
+def test_render_with_mixed_label_types():
+    registry = MetricsRegistry()
+    errors = registry.counter('tg_errors_total', 'errors', ['method', 'code'])
+    latency = registry.histogram('tg_seconds', 'latency', ['method'], buckets=(1,))
+    errors.inc('sendMessage', 'TimedOut')
+    errors.inc('sendMessage', 403)
+    latency.observe('sendMessage', value=0.5)
+    latency.observe(None, value=2)
+
+    text = registry.render()
+    assert 'tg_errors_total{method="sendMessage",code="403"} 1' in text
+    assert 'tg_errors_total{method="sendMessage",code="TimedOut"} 1' in text
+    assert 'tg_seconds_count{method="sendMessage"} 1' in text
@@ -0,0 +1,78 @@
+from app import db
+from app.migrations import run_migrations, current_version, MIGRATIONS
+from app.models import GroupUser, BotGroup, ProfileNgram
+from app.modules.core.routes import _checked_in_today_query, _expired_users_query
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+from datetime import datetime, timedelta
+import json
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+def _legacy_schema():
+    """Tables as a deployment from before the migration runner had them."""
+    db.create_all()
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_group_users_online_checkin"))
+        conn.execute(text("DROP INDEX ix_group_users_expiry_pending"))
+        conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+
+def _plan(query):
+    """EXPLAIN QUERY PLAN details for an ORM query, with its real bind parameters."""
+    compiled = query.statement.compile(dialect=sqlite.dialect(paramstyle='named'))
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), compiled.params).all()
+    return [r[-1] for r in rows]
+
+def _plans():
+    return {
+        'do_query_page': _plan(_checked_in_today_query(1, NOW.replace(hour=0))),
+        'check_expired_users': _plan(_expired_users_query(NOW).limit(100)),
+    }
+
+def test_migrations_index_hot_queries(app):
+    _legacy_schema()
+    before = _plans()
+    run_migrations()
+    after = _plans()
+    for name in before:
+        print(f"\n{name}\n  before: {before[name]}\n  after:  {after[name]}")
+
+    assert not any('ix_group_users_online_checkin' in d for d in before['do_query_page'])
+    assert any('ix_group_users_online_checkin' in d for d in after['do_query_page'])
+    assert not any('ix_group_users_expiry_pending' in d for d in before['check_expired_users'])
+    assert any('ix_group_users_expiry_pending' in d for d in after['check_expired_users'])
+    # 过期扫描按索引顺序读取，不需要额外排序
+    assert not any('TEMP B-TREE' in d for d in after['check_expired_users'])
+
+def test_migrations_are_recorded_once(app):
+    _legacy_schema()
+    assert run_migrations() == MIGRATIONS[-1][0]
+    assert current_version() == MIGRATIONS[-1][0]
+    run_migrations()
+    count = db.session.execute(text("SELECT COUNT(*) FROM schema_version")).scalar()
+    assert count == len(MIGRATIONS)
+
+def test_profile_backfill_rolls_back_with_its_version(app, monkeypatch):
+    _legacy_schema()
+    g = BotGroup(chat_id='-100', title='g', type='supergroup', is_active=True)
+    db.session.add(g)
+    db.session.flush()
+    db.session.add(GroupUser(group_id=g.id, tg_id=1, profile_data=json.dumps({'name': '南山'}), expiration_date=NOW - timedelta(days=1)))
+    db.session.commit()
+
+    # v4 的回填与 schema_version 在同一事务里：写版本失败时回填也不保留
+    import app.migrations as migrations
+    failing = [(v, d, f) for v, d, f in MIGRATIONS if v < 4]
+    failing.append((4, 'backfill profile n-gram index', lambda conn: (migrations._backfill_profile_index(conn), 1 / 0)))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', failing)
+    try:
+        migrations.run_migrations()
+    except ZeroDivisionError:
+        pass
+    assert current_version() == 3
+    assert ProfileNgram.query.count() == 0
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    run_migrations()
+    assert ProfileNgram.query.filter_by(gram='南山').count() == 1
@@ -0,0 +1,36 @@
+from app.outbound import OutboundScheduler, TokenBucket
+from telegram.error import RetryAfter
+import asyncio
+
+def test_block_does_not_refill_during_the_pause():
+    bucket = TokenBucket(rate=1.0, capacity=20)
+    bucket.block(until=bucket.updated + 5)
+    assert bucket.delay(bucket.updated - 1) > 0
+    # 暂停结束 2 秒后只恢复了 2 个令牌，而不是整桶
+    bucket.delay(bucket.blocked_until + 2)
+    assert bucket.tokens == 2
+
+def test_tasks_are_referenced_until_done_and_failures_logged(capsys):
+    async def _main():
+        scheduler = OutboundScheduler()
+        scheduler.start()
+        calls = []
+
+        async def _send(n):
+            calls.append(n)
+            if len(calls) == 1:
+                raise RetryAfter(0)
+            return n
+
+        result = await scheduler.call(0, None, _send, 7)
+        scheduler._spawn(_boom())
+        await asyncio.sleep(0.01)
+        # 除常驻的 dispatcher 外，已完成的任务都已释放
+        return result, calls, len(scheduler._tasks)
+
+    async def _boom():
+        raise RuntimeError('boom')
+
+    result, calls, tasks = asyncio.run(_main())
+    assert (result, calls, tasks) == (7, [7, 7], 1)
+    assert 'boom' in capsys.readouterr().out
@@ -0,0 +1,52 @@
+from app.page_cache import QueryPageCache
+from app.snapshots import SnapshotStore, QuerySnapshot
+from datetime import datetime
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+def test_evicted_snapshot_drops_cached_page():
+    cache, store = QueryPageCache(), SnapshotStore(maxsize=2)
+    store.add_listener(cache.discard_snapshots)
+
+    sid = store.create(QuerySnapshot(1, None, NOW.date(), NOW))
+    key = cache.key(1, None, 1, 0)
+    cache.put(key, ('page', None, 3), sid)
+    other = cache.key(2, None, 1, 0)
+    cache.put(other, ('page', None, 0))
+    assert cache.get(key) is not None
+
+    store.create(QuerySnapshot(1, 'kw', NOW.date(), NOW))
+    store.create(QuerySnapshot(1, 'kw2', NOW.date(), NOW))  # 超出 maxsize，最早的快照被淘汰
+    assert store.get(sid) is None
+    assert cache.get(key) is None
+    assert cache.get(other) is not None
+
+def test_overwritten_page_forgets_old_snapshot():
+    cache = QueryPageCache()
+    key = cache.key(1, None, 1, 0)
+    cache.put(key, ('old', None, 1), 'a')
+    cache.put(key, ('new', None, 1), 'b')
+    cache.discard_snapshots(['a'])
+    assert cache.get(key)[0] == 'new'
+    cache.invalidate(1)
+    cache.discard_snapshots(['b'])
+    assert cache.stats()['size'] == 0
+
+def test_result_key_shares_one_snapshot_until_generation_changes():
+    cache, store = QueryPageCache(), SnapshotStore()
+    key = cache.result_key(1, 'kw')
+    assert store.find(key) == (None, None)
+    sid = store.create(QuerySnapshot(1, 'kw', NOW.date(), NOW), key)
+    assert store.find(cache.result_key(1, 'kw'))[0] == sid
+    # 两个页共用一个快照，快照淘汰时都要丢掉
+    cache.put(cache.key(1, 'kw', 1, 0), ('p1', None, 1), sid)
+    cache.put(cache.key(1, 'kw', 2, 0), ('p2', None, 1), sid)
+    cache.discard_snapshots([sid])
+    assert cache.stats()['size'] == 0
+    cache.invalidate(1)
+    assert store.find(cache.result_key(1, 'kw')) == (None, None)
+
+def test_snapshot_close_to_expiry_is_not_reused():
+    store = SnapshotStore(ttl=1)
+    store.create(QuerySnapshot(1, None, NOW.date(), NOW), 'k')
+    assert store.find('k') == (None, None)
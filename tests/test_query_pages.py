@@ -0,0 +1,39 @@
+from app import db
+from app.models import GroupUser, BotGroup
+from app.modules.core.routes import _sql_snapshot_page
+from app.snapshots import QuerySnapshot
+from sqlalchemy import event
+from datetime import datetime, timedelta
+import json
+
+NOW = datetime(2026, 10, 18, 9, 0)
+CONF = {'page_size': 3, 'template': '{tg_id}'}
+
+def _seed(n):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    db.session.add_all([GroupUser(group_id=group.id, tg_id=1000 + i, online=True, checkin_time=NOW - timedelta(minutes=i),
+                                  profile_data=json.dumps({'name': f'u{i}'})) for i in range(n)])
+    db.session.commit()
+    return group.id
+
+def test_sql_page_reads_only_the_page(app):
+    group_id = _seed(10)
+    snap = QuerySnapshot(group_id, None, NOW.replace(hour=0), NOW)
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda c, cur, stmt, *a: statements.append(stmt))
+
+    text, markup, total = _sql_snapshot_page(CONF, [], snap, 2, 'sid')
+    assert total == 10
+    # 按 id 倒序的第 2 页：第 7、6、5 个用户
+    assert [l for l in text.splitlines() if l.isdigit()] == ['1006', '1005', '1004']
+    assert any('LIMIT' in s and 'OFFSET' in s for s in statements)
+
+def test_sql_page_excludes_checkins_after_snapshot(app):
+    group_id = _seed(4)
+    db.session.add(GroupUser(group_id=group_id, tg_id=1, online=True, checkin_time=NOW + timedelta(minutes=1)))
+    db.session.commit()
+    _, _, total = _sql_snapshot_page(CONF, [], QuerySnapshot(group_id, None, NOW.replace(hour=0), NOW), 1, 'sid')
+    assert total == 4
@@ -0,0 +1,135 @@
+from app.services import sanitize_html_for_telegram, _sanitize
+import re
+import timeit
+
+# 改写前的实现，作为输出一致性与性能对比的基准
+def _reference_sanitize(text):
+    if not text:
+        return text
+    
+    # List of allowed tags (without attributes, except special cases)
+    allowed_tags = {
+        'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del',
+        'code', 'pre', 'tg-spoiler', 'tg-emoji'
+    }
+    
+    # Pattern to match HTML tags
+    # This will match opening tags, closing tags, and self-closing tags
+    tag_pattern = r'<(/?)([a-zA-Z][\w-]*)((?:\s+[^>]*)?)>'
+    
+    # Track which special tags (a, span) have valid openings
+    # We need to track opening tags to know if closing tags are valid
+    valid_openings = []
+    result_parts = []
+    last_end = 0
+    
+    for match in re.finditer(tag_pattern, text):
+        # Add text before this tag
+        result_parts.append(text[last_end:match.start()])
+        last_end = match.end()
+        
+        is_closing = match.group(1)  # '/' if closing tag, '' if opening
+        tag_name = match.group(2).lower()
+        attributes = match.group(3)  # Everything between tag name and >
+        
+        # Special handling for <a> tags - keep href attribute
+        if tag_name == 'a':
+            if not is_closing:
+                # Extract href attribute if present
+                href_match = re.search(r'href\s*=\s*["\']([^"\']*)["\']', attributes, re.IGNORECASE)
+                if href_match:
+                    href_value = href_match.group(1)
+                    # Escape any quotes in href
+                    href_value = href_value.replace('"', '&quot;')
+                    result_parts.append(f'<a href="{href_value}">')
+                    valid_openings.append('a')
+                else:
+                    # <a> without href is invalid, remove it
+                    pass
+            else:
+                # Closing </a> tag - only keep if we have a valid opening
+                if valid_openings and valid_openings[-1] == 'a':
+                    result_parts.append('</a>')
+                    valid_openings.pop()
+            continue
+        
+        # Special handling for <span> tags - only allow with class="tg-spoiler"
+        if tag_name == 'span':
+            if not is_closing:
+                # Check if it has class="tg-spoiler"
+                # Use proper regex to extract class attribute value
+                class_match = re.search(r'class\s*=\s*["\']([^"\']*)["\']', attributes, re.IGNORECASE)
+                if class_match and 'tg-spoiler' == class_match.group(1).strip():
+                    result_parts.append('<span class="tg-spoiler">')
+                    valid_openings.append('span')
+                else:
+                    # Invalid span tag, remove but keep content
+                    pass
+            else:
+                # Closing </span> tag - only keep if we have a valid opening
+                if valid_openings and valid_openings[-1] == 'span':
+                    result_parts.append('</span>')
+                    valid_openings.pop()
+            continue
+        
+        # For allowed tags, return them without attributes
+        if tag_name in allowed_tags:
+            result_parts.append(f'<{is_closing}{tag_name}>')
+            continue
+        
+        # For disallowed tags, remove them but keep their content
+        # (do nothing, just skip the tag)
+    
+    # Add remaining text after last tag
+    result_parts.append(text[last_end:])
+    
+    return ''.join(result_parts)
+
+SAMPLES = [
+    '',
+    'plain text',
+    '🔍 <b>今日在线：</b>',
+    '<div><p>段落</p></div>',
+    '<a href="https://t.me/x">链接</a> <a>无 href</a></a>',
+    "<A HREF='https://e.com/?a=1&b=\"2\"'>x</A>",
+    '<span class="tg-spoiler">剧透</span><span class="x">普通</span></span>',
+    '<b class="x">粗</b><i>斜</i><u>下</u><s>删</s><code>c</code><pre>p</pre>',
+    '<tg-spoiler>s</tg-spoiler><tg-emoji emoji-id="1">👍</tg-emoji>',
+    '1 < 2 and 3 > 2 <br/> <img src="x"> <script>alert(1)</script>',
+    '<b><i>未闭合',
+    '<b >空格</b > <B>大写</B> <bx>未知</bx> <b/> </ b> <abc',
+]
+
+def _roster(pages, page_size=10, links=False):
+    """A long query reply: header plus `pages` pages of templated roster lines."""
+    lines = ['🔍 <b>今日在线：</b>', '']
+    for n in range(pages * page_size):
+        name = f'<a href="tg://user?id={1000 + n}">用户{n}</a>' if links else f'<b>用户{n}</b>'
+        lines.append(f'🟢 {n + 1}. {name} | <code>南山</code> | <i>到期 2026-12-31</i>')
+    return '\n'.join(lines)
+
+def _rate(fn, text, number=20):
+    return number / min(timeit.repeat(lambda: fn(text), number=number, repeat=7))
+
+def test_matches_reference_output():
+    for text in SAMPLES + [_roster(1), _roster(20), _roster(1, links=True), _roster(20, links=True)]:
+        assert sanitize_html_for_telegram(text) == _reference_sanitize(text), text
+
+def test_long_roster_throughput():
+    """Micro-benchmark: uncached sanitizer vs the previous implementation on multi-page rosters."""
+    for links in (False, True):
+        for pages in (5, 50):
+            text = _roster(pages, links=links)
+            old, new = _rate(_reference_sanitize, text), _rate(_sanitize, text)
+            print(f"\n{pages} pages{' with links' if links else ''} ({len(text)} chars): "
+                  f"old {old:.0f}/s  new {new:.0f}/s  x{new / old:.2f}")
+            if not links:
+                # 只含合规标签的名单整段原样返回，差距大到不受机器抖动影响
+                assert new > old * 5
+
+def test_repeated_messages_are_memoized():
+    text = '✅ <b>打卡成功</b> <a href="https://t.me/x">规则</a>'
+    sanitize_html_for_telegram(text)
+    cached, fresh = _rate(sanitize_html_for_telegram, text, 2000), _rate(_sanitize, text, 2000)
+    print(f"\nshort message: memoized {cached:.0f}/s  uncached {fresh:.0f}/s")
+    assert cached > fresh
@@ -0,0 +1,51 @@
+from app import db
+from app.models import GroupUser, BotGroup
+from app.roster import RosterEntry
+from app.search import index_profile, keyword_filter
+from sqlalchemy.dialects import postgresql
+import json
+import pytest
+
+PROFILES = {
+    1: {'name': 'Alice', 'region': '福田'},
+    2: {'name': 'namxame', 'note': 'a"bc'},  # 键名 name 的 bigram 全在值里，但值本身不含 name
+    3: {'name': 'BOB', 'region': '南山', 'age': 30},
+    4: {'name': '张三', 'tags': ['alice']},  # 列表值不参与搜索
+}
+KEYWORDS = ['alice', 'ALI', 'name', 'a"bc', 'bob', 'Bo', '福田', '南', '30', '%', 'x_a']
+
+@pytest.fixture
+def group_id(app):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    for tg_id, profile in PROFILES.items():
+        # 混用转义与不转义的 JSON，值级校验不受存储格式影响
+        u = GroupUser(group_id=group.id, tg_id=tg_id, profile_data=json.dumps(profile, ensure_ascii=tg_id % 2 == 0))
+        db.session.add(u)
+        db.session.flush()
+        index_profile(group.id, u.id, profile)
+    db.session.commit()
+    return group.id
+
+@pytest.mark.parametrize('kw', KEYWORDS)
+def test_sql_matches_roster(group_id, kw):
+    rows = GroupUser.query.filter(*keyword_filter(group_id, kw)).with_entities(GroupUser.tg_id).all()
+    expected = sorted(tg for tg, p in PROFILES.items() if RosterEntry(tg, tg, p, None).matches(kw))
+    assert sorted(t for (t,) in rows) == expected
+
+def test_expected_matches(group_id):
+    match = lambda kw: sorted(t for (t,) in GroupUser.query.filter(*keyword_filter(group_id, kw)).with_entities(GroupUser.tg_id))
+    assert match('ALI') == [1]
+    assert match('name') == []
+    assert match('a"bc') == [2]
+    assert match('bob') == [3]
+
+def test_postgres_value_check_compiles(app):
+    # 值级校验在 PostgreSQL 上走 jsonb_each，不再对原始 JSON 做 LIKE
+    from unittest import mock
+    with mock.patch.object(type(db.engine.dialect), 'name', 'postgresql'):
+        criteria = keyword_filter(1, 'Alice')
+    sql = str(GroupUser.query.filter(*criteria).statement.compile(dialect=postgresql.dialect()))
+    assert 'jsonb_each' in sql and 'profile_data LIKE' not in sql
@@ -0,0 +1,33 @@
+from app import db
+from app.models import GroupUser, BotGroup
+from app.search import index_profile
+import pytest
+
+@pytest.fixture
+def client(app):
+    db.create_all()
+    group = BotGroup(chat_id='-100', title='g')
+    db.session.add(group)
+    db.session.flush()
+    for tg_id, name in ((42, 'x²'), (43, 'y')):
+        u = GroupUser(group_id=group.id, tg_id=tg_id, profile_data='{}')
+        db.session.add(u)
+        db.session.flush()
+        index_profile(group.id, u.id, {'name': name})
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+        sess['current_group_id'] = group.id
+    return client
+
+@pytest.mark.parametrize('keyword, expected', [
+    ('42', [42]),
+    ('²', [42]),  # Unicode 数字按资料关键词查，不当作 tg_id
+    ('١', []),
+    ('9' * 30, []),
+])
+def test_keyword_search(client, keyword, expected):
+    data = client.get('/core/api/users', query_string={'keyword': keyword, 'fields': 'tg_id'}).get_json()
+    assert data['status'] == 'ok'
+    assert [u['tg_id'] for u in data['users']] == expected
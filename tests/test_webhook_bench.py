@@ -0,0 +1,103 @@
+from app.ingress import UpdateIngress
+from app.webhook_server import WebhookServer, WEBHOOK_PATH
+from werkzeug.serving import make_server
+import app.modules.core.routes as routes
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+
+UPDATES = 2000
+CLIENTS = 8
+
+class _CountingApp:
+    """Stands in for the PTB Application: the benchmark only measures delivery to process_update()."""
+    bot = None
+
+    def __init__(self):
+        self.processed = 0
+
+    async def process_update(self, update):
+        self.processed += 1
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _update(n):
+    return json.dumps({'update_id': n, 'message': {
+        'message_id': n, 'date': 0, 'text': '打卡',
+        'chat': {'id': -100, 'type': 'supergroup', 'title': 'g'},
+        'from': {'id': 1000 + n % 50, 'is_bot': False, 'first_name': 'u'},
+    }}).encode()
+
+def _post_all(port):
+    """CLIENTS threads POST UPDATES updates in total over keep-alive connections."""
+    statuses = []
+
+    def _client(k):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        for n in range(k, UPDATES, CLIENTS):
+            conn.request('POST', WEBHOOK_PATH, _update(n), {'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            resp.read()
+            statuses.append(resp.status)
+        conn.close()
+
+    threads = [threading.Thread(target=_client, args=(k,)) for k in range(CLIENTS)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return statuses
+
+def _measure(port, ptb_app):
+    start = time.perf_counter()
+    statuses = _post_all(port)
+    while ptb_app.processed < UPDATES and time.perf_counter() - start < 60:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    assert statuses.count(200) == UPDATES and ptb_app.processed == UPDATES
+    return UPDATES / elapsed
+
+def test_native_listener_outperforms_flask_webhook(app, monkeypatch):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    run = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def _ingress(ptb_app):
+        ingress = UpdateIngress(maxsize=UPDATES * 2)
+        ingress.start(ptb_app)
+        return ingress
+
+    async def _cancel_workers():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # 现有路径：Flask 线程服务器（与 run.py 一致的 threaded=True）收 Update，再跨线程投递到 Bot Loop
+    flask_ptb = _CountingApp()
+    monkeypatch.setattr(routes, 'global_ptb_app', flask_ptb)
+    monkeypatch.setattr(routes, 'update_ingress', run(_ingress(flask_ptb)))
+    flask_port = _free_port()
+    server = make_server('127.0.0.1', flask_port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 原生监听：Bot Loop 上直接解析并入队
+    native_ptb = _CountingApp()
+    native_port = _free_port()
+    listener = WebhookServer(native_ptb, run(_ingress(native_ptb)), host='127.0.0.1', port=native_port)
+    run(listener.start())
+
+    try:
+        flask_rate = _measure(flask_port, flask_ptb)
+        native_rate = _measure(native_port, native_ptb)
+    finally:
+        server.shutdown()
+        run(listener.stop())
+        run(_cancel_workers())
+        loop.call_soon_threadsafe(loop.stop)
+
+    print(f"\nwebhook updates/sec: flask {flask_rate:.0f}  native {native_rate:.0f}  x{native_rate / flask_rate:.2f}")
+    assert native_rate > flask_rate